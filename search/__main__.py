@@ -1,6 +1,7 @@
 import argparse
 import datetime
 from search import Search
+from stats import Stats
 from components import Coordinate
 
 if __name__ == "__main__":
@@ -8,15 +9,39 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog='FindBestStation',
                                      description='Return the top N number of cheapest gaz station near you')
     parser.add_argument('--latitude', help='You current latitue',
-                        required=True, type=Coordinate.validate_latitude)
+                        type=Coordinate.validate_latitude)
     parser.add_argument('--longitude', help='Your current longitude',
-                        required=True, type=Coordinate.validate_longitude)
-    parser.add_argument('--radius', help='Your current radius', required=True, type=float)
-    parser.add_argument('--date', help="Today's date, format yyyy-MM-dd", required=True,
+                        type=Coordinate.validate_longitude)
+    parser.add_argument('--radius', help='Your current radius', type=float)
+    parser.add_argument('--date', help="Today's date, format yyyy-MM-dd",
                         type=lambda s: datetime.datetime.strptime(s, '%Y-%m-%d'))
     parser.add_argument('--gaz_type', help='Requested gaz type',
-                        choices=['Gazole', 'SP95', 'SP98', 'GPLc', 'E10', 'E85'],
-                        required=True)
+                        choices=['Gazole', 'SP95', 'SP98', 'GPLc', 'E10', 'E85'])
+    parser.add_argument('--query', help='Search the best stations, compute the area price statistics '
+                        'or serve the search over HTTP',
+                        choices=['search', 'stats', 'serve'], default='search')
+    parser.add_argument('--end_date', help="Last day of the statistics, format yyyy-MM-dd. Default to --date",
+                        type=lambda s: datetime.datetime.strptime(s, '%Y-%m-%d'))
+    parser.add_argument('--host', help='Address the service listens on', default='127.0.0.1')
+    parser.add_argument('--port', help='Port the service listens on', type=int, default=8080)
+    parser.add_argument('--workers', help='Number of threads running the searches of the service',
+                        type=int, default=4)
+    parser.add_argument('--max_pending', help='Number of pending searches above which the service answers 503',
+                        type=int, default=32)
     args = parser.parse_args()
 
-    Search.main(args)
+    if args.query == 'serve':
+        Search.serve(args)
+    else:
+        missing = [name for name in ('latitude', 'longitude', 'radius', 'date', 'gaz_type')
+                   if getattr(args, name) is None]
+        if missing:
+            parser.error('the following arguments are required: {}'.format(
+                ', '.join('--' + name for name in missing)))
+
+        if args.query == 'stats':
+            if args.end_date is not None and args.end_date < args.date:
+                parser.error('--end_date must not be before --date')
+            Stats.main(args)
+        else:
+            Search.main(args)
@@ -1,10 +1,16 @@
 from components import User, Station, Gaz
 from search_utils.xml_parser_utils import XMLParser
 from search_utils.io_utils import IOUtils
+from search_utils.ingest_utils import Ingestor, PriceDataset
+from search_utils.geohash_utils import GeoHash
+from service import SearchService
 
+import asyncio
 import datetime
 import logging
 import time
+import threading
+from collections import OrderedDict
 from xml.etree.cElementTree import Element
 from haversine import haversine
 
@@ -19,10 +25,13 @@ class Search:
         Maximum number of stations to keep
     HAVERSINE: Haversine
         Used to compute haversine distance
+    SECONDS_PER_DAY: int
+        Number of seconds in a day
     """
 
     TOP_N_STATIONS = 10
     HAVERSINE = haversine.Haversine()
+    SECONDS_PER_DAY = 86400
 
     @classmethod
     def process_station(cls, user: User, element: Element) -> Station:
@@ -141,6 +150,31 @@ class Search:
 
         return stations_to_keep
 
+    @classmethod
+    def process_dataset(cls, dataset: PriceDataset, user: User, requested_gaz: Gaz) -> dict:
+        """
+        Extract the stations from the ingested data, using the normalized values of the dataset
+        Only the stations of the user area, and the stations sharing their id, are extracted:
+        it is a subset of the stations returned by process_data, which only gives the same result
+        once passed to find_stations. Do not use it as a replacement of process_data anywhere else
+
+        :param dataset:       the ingested data
+        :param user:          the user attributes requesting the stations
+        :param requested_gaz: the gaz type requested by the user
+        :return: a dictionary containing the stations with the station id as key and the station as value,
+                 to be given to find_stations
+        """
+        user_location = user.get_position()
+        start = Ingestor.to_timestamp(user.date)
+
+        stations = dataset.get_priced_stations(position=user_location, radius=user.radius,
+                                               distance=cls.HAVERSINE.distance, gaz_id=requested_gaz.id,
+                                               start=start, end=start + cls.SECONDS_PER_DAY)
+
+        return {station_id: Station(id=station_id, latitude=latitude, longitude=longitude, price=price,
+                                    distance=cls.HAVERSINE.distance(user_location, (latitude, longitude)))
+                for station_id, (latitude, longitude, price) in stations}
+
     @classmethod
     def get_eligible_stations(cls, user: User, stations: dict) -> filter:
         """
@@ -219,7 +253,7 @@ class Search:
         return result
 
     @classmethod
-    def run(cls, args, ressources_path: str, output_path: str):
+    def run(cls, args, ressources_path: str, dataset_path: str, report_path: str, output_path: str):
         """Execute the sear to find the top best gaz stations matching the user request"""
 
         load_start_time = time.time()
@@ -229,9 +263,9 @@ class Search:
 
         gaz = Gaz(gaz_type=args.gaz_type)
 
-        station_data = XMLParser.load_data(path=ressources_path)
+        dataset = Ingestor.load(ressources_path=ressources_path, dataset_path=dataset_path, report_path=report_path)
 
-        extracted_stations = cls.process_data(data=station_data, user=user, requested_gaz=gaz)
+        extracted_stations = cls.process_dataset(dataset=dataset, user=user, requested_gaz=gaz)
 
         execution_time = (time.time() - load_start_time) * 1000
         logging.warning("--- {time} ms for data loading---".format(time=execution_time))
@@ -250,6 +284,175 @@ class Search:
     @staticmethod
     def main(args):
         ressources_path = "ressources/oil_data/PrixCarburants_annuel_2022.xml"
+        dataset_path = "ressources/oil_data/PrixCarburants_annuel_2022.gsf"
+        report_path = "outputs/rejections.json"
         output_path = "outputs/results.json"
 
-        Search.run(args=args, ressources_path=ressources_path, output_path=output_path)
+        Search.run(args=args, ressources_path=ressources_path, dataset_path=dataset_path,
+                   report_path=report_path, output_path=output_path)
+
+    @staticmethod
+    def serve(args):
+        """Serve the search over HTTP, sharing a SearchCache between the requests"""
+        ressources_path = "ressources/oil_data/PrixCarburants_annuel_2022.xml"
+        dataset_path = "ressources/oil_data/PrixCarburants_annuel_2022.gsf"
+        report_path = "outputs/rejections.json"
+
+        dataset = Ingestor.load(ressources_path=ressources_path, dataset_path=dataset_path, report_path=report_path)
+        cache = SearchCache(dataset=dataset)
+
+        service = SearchService(
+            search=lambda user, gaz: Search.format_output(gaz=gaz, stations=cache.find_stations(
+                user=user, requested_gaz=gaz)),
+            max_workers=args.workers, max_pending=args.max_pending, get_cache_counters=cache.get_counters)
+
+        asyncio.run(service.serve(host=args.host, port=args.port))
+
+
+class SearchCache:
+    """
+    In-memory cache of the search results for near-duplicate requests
+
+    The requests are bucketed by the geohash cell of the user position, the radius, the date and the gaz type.
+    For each bucket, the candidate stations are fetched once for a radius expanded to cover the whole cell.
+    The candidates are then filtered and ranked again by the exact distance to each user, so the result is
+    the same as the one of Search.find_stations.
+
+    The cache is shared by the threads of the service. The lock only guards the lookup, the counters and the LRU
+    order: the candidates are fetched outside of it, so a slow fill does not block the requests of the other
+    buckets. Concurrent misses on the same bucket wait for the thread already filling it instead of fetching again.
+
+    Attributes
+    ----------
+    GEOHASH_PRECISION: int
+        Number of characters of the geohash used to bucket the user positions (cells of ~1.2 x 0.6 km)
+    RADIUS_MARGIN: float
+        Margin added to the expanded radius to absorb the rounding errors (in km)
+    """
+
+    GEOHASH_PRECISION = 6
+    RADIUS_MARGIN = 0.001
+
+    def __init__(self, dataset: PriceDataset, max_size: int = 1024) -> None:
+        self.dataset = dataset
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.filling = {}
+        self.lock = threading.Lock()
+
+    def get_counters(self) -> dict:
+        """Return the hit, miss and eviction counters and the current size of the cache"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+        }
+
+    def get_expanded_radius(self, geohash: str, radius: float) -> tuple:
+        """
+        Return the center of a geohash cell and a radius around it covering the user radius from any point of the cell
+
+        :param geohash: the geohash of the cell
+        :param radius:  the user radius (in km)
+        :return: a tuple (center, expanded radius)
+        """
+        min_latitude, max_latitude, min_longitude, max_longitude = GeoHash.decode_bounds(geohash=geohash)
+        center = ((min_latitude + max_latitude) / 2, (min_longitude + max_longitude) / 2)
+
+        half_diagonal = max(Search.HAVERSINE.distance(center, corner) for corner in (
+            (min_latitude, min_longitude), (min_latitude, max_longitude),
+            (max_latitude, min_longitude), (max_latitude, max_longitude)))
+
+        return center, radius + half_diagonal + self.RADIUS_MARGIN
+
+    def fetch_candidates(self, center: tuple, radius: float, requested_gaz: Gaz, date: datetime) -> list:
+        """
+        Fetch the stations around a position having a price updated at the requested date
+        When a station id is duplicated in the input data, the stations are resolved as Search.process_data does
+
+        :param center:        the position around which the stations are fetched
+        :param radius:        the radius in which the stations must be (in km)
+        :param requested_gaz: the gaz type requested by the user
+        :param date:          the requested date
+        :return: a list of (id, (latitude, longitude, price)) in the order Search.process_data would keep them
+        """
+        start = Ingestor.to_timestamp(date)
+
+        return self.dataset.get_priced_stations(position=center, radius=radius, distance=Search.HAVERSINE.distance,
+                                                gaz_id=requested_gaz.id, start=start,
+                                                end=start + Search.SECONDS_PER_DAY)
+
+    def get_candidates(self, user: User, requested_gaz: Gaz) -> list:
+        """
+        Return the candidate stations of the user bucket, fetching them when they are not cached yet
+        Thread-safe, only one thread fetches the candidates of a bucket at a time
+
+        :param user:          the user attributes requesting the stations
+        :param requested_gaz: the gaz type requested by the user
+        :return: the candidate stations of the bucket
+        """
+        geohash = GeoHash.encode(latitude=user.latitude, longitude=user.longitude, precision=self.GEOHASH_PRECISION)
+        key = (geohash, user.radius, user.date, requested_gaz.id)
+
+        while True:
+
+            with self.lock:
+
+                entry = self.entries.get(key)
+
+                if entry is not None:
+                    center, expanded_radius, candidates = entry
+                    if Search.HAVERSINE.distance(user.get_position(), center) + user.radius <= expanded_radius:
+                        self.hits += 1
+                        self.entries.move_to_end(key)
+                        return candidates
+
+                filled = self.filling.get(key)
+
+                if filled is None:
+                    self.misses += 1
+                    filled = self.filling[key] = threading.Event()
+                    break
+
+            filled.wait()
+
+        try:
+            center, expanded_radius = self.get_expanded_radius(geohash=geohash, radius=user.radius)
+            candidates = self.fetch_candidates(center=center, radius=expanded_radius,
+                                               requested_gaz=requested_gaz, date=user.date)
+
+            with self.lock:
+                self.entries[key] = (center, expanded_radius, candidates)
+                self.entries.move_to_end(key)
+
+                if len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+
+        finally:
+            with self.lock:
+                del self.filling[key]
+            filled.set()
+
+        return candidates
+
+    def find_stations(self, user: User, requested_gaz: Gaz) -> list:
+        """
+        Execute the station search according to the user attributes using the cached candidates
+
+        :param user:          the user attributes requesting the stations
+        :param requested_gaz: the gaz type requested by the user
+        :return: the top n station sorted by price inside the user area
+        """
+        user_location = user.get_position()
+        stations = {}
+
+        for station_id, (latitude, longitude, price) in self.get_candidates(user=user, requested_gaz=requested_gaz):
+            stations[station_id] = Station(id=station_id, latitude=latitude, longitude=longitude, price=price,
+                                           distance=Search.HAVERSINE.distance(user_location, (latitude, longitude)))
+
+        return Search.find_stations(user=user, stations=stations)
@@ -0,0 +1,265 @@
+import json
+import math
+import os
+import struct
+
+
+class PriceEncoder:
+    """
+    Compact encoding of the price history
+
+    A series is the list of the price updates of a station for a gaz type.
+    It starts with the number of decimals of its prices, then each update is stored as two zigzag varints:
+      - the delta of the update date with the previous one (epoch seconds)
+      - the delta of the price with the previous one, as integer in the scale of the series
+
+    The prices are integer millis (3 decimals) unless a price of the series needs more decimals to be
+    stored without loss. When no scale up to MAX_DECIMALS is exact, the series stores the bits of the
+    double prices instead of their deltas (RAW_DECIMALS), so any price the search accepts is kept as is.
+
+    A dataset file starts with MAGIC, FORMAT_VERSION and the metadata (length in bytes and JSON),
+    then the number of stations, then for each station:
+    its id, its latitude and longitude (double), its number of series and for each series
+    the gaz id, the length in bytes and the encoded series.
+    """
+
+    MAGIC = b"GSF1"
+    FORMAT_VERSION = 3
+    DECIMALS = 3
+    MAX_DECIMALS = 15
+    RAW_DECIMALS = -1
+    RAW_FORMAT = struct.Struct("<d")
+    RAW_INTEGER_FORMAT = struct.Struct("<q")
+    COORDINATES_FORMAT = struct.Struct("<dd")
+
+    @staticmethod
+    def encode_varint(value: int, buffer: bytearray) -> None:
+        """Append a zigzag varint to the buffer, any integer is encoded without loss whatever its size"""
+        value = value << 1 if value >= 0 else (-value << 1) - 1
+        while value > 0x7f:
+            buffer.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buffer.append(value)
+
+    @staticmethod
+    def decode_varints(data: bytes):
+        """
+        Stream the zigzag varints of the data
+
+        :param data: the encoded data
+        :return: a generator of the decoded integers
+        """
+        value = 0
+        shift = 0
+        for byte in data:
+            value |= (byte & 0x7f) << shift
+            if byte & 0x80:
+                shift += 7
+                continue
+            yield (value >> 1) ^ -(value & 1)
+            value = 0
+            shift = 0
+
+    @classmethod
+    def get_decimals(cls, prices: list) -> int:
+        """
+        Return the smallest number of decimals storing all the prices without loss
+
+        :param prices: the prices of a series
+        :return: the number of decimals, or RAW_DECIMALS if no scale is exact
+        """
+        if any(price == 0 and math.copysign(1, price) < 0 for price in prices):
+            return cls.RAW_DECIMALS
+
+        for decimals in range(cls.DECIMALS, cls.MAX_DECIMALS + 1):
+            scale = 10 ** decimals
+            try:
+                if all(round(price * scale) / scale == price for price in prices):
+                    return decimals
+            except (ValueError, OverflowError):
+                break
+        return cls.RAW_DECIMALS
+
+    @classmethod
+    def encode_series(cls, updates: list) -> bytes:
+        """
+        Encode the updates of a series
+
+        :param updates: the list of (timestamp, price) in the order of the input data
+        :return: the encoded series
+        """
+        decimals = cls.get_decimals(prices=[price for _, price in updates])
+
+        buffer = bytearray()
+        cls.encode_varint(decimals, buffer)
+
+        previous_timestamp = 0
+        previous_value = 0
+
+        for timestamp, price in updates:
+            cls.encode_varint(timestamp - previous_timestamp, buffer)
+            previous_timestamp = timestamp
+
+            if decimals == cls.RAW_DECIMALS:
+                cls.encode_varint(cls.RAW_INTEGER_FORMAT.unpack(cls.RAW_FORMAT.pack(price))[0], buffer)
+            else:
+                value = round(price * 10 ** decimals)
+                cls.encode_varint(value - previous_value, buffer)
+                previous_value = value
+
+        return bytes(buffer)
+
+    @classmethod
+    def decode_series(cls, data: bytes):
+        """
+        Stream the updates of an encoded series without decoding it entirely
+
+        :param data: the encoded series
+        :return: a generator of (timestamp, price)
+        """
+        values = cls.decode_varints(data)
+        decimals = next(values, None)
+
+        if decimals is None:
+            return
+
+        timestamp = 0
+        value = 0
+
+        if decimals == cls.RAW_DECIMALS:
+            for timestamp_delta in values:
+                timestamp += timestamp_delta
+                yield timestamp, cls.RAW_FORMAT.unpack(cls.RAW_INTEGER_FORMAT.pack(next(values)))[0]
+            return
+
+        scale = 10 ** decimals
+
+        for timestamp_delta in values:
+            timestamp += timestamp_delta
+            value += next(values)
+            yield timestamp, value / scale
+
+    @staticmethod
+    def read_varint(file) -> int:
+        """
+        Read a zigzag varint from a file
+
+        :param file: the file opened in binary mode
+        :return: the decoded integer
+        :raises ValueError: if the file ends before the varint
+        """
+        value = 0
+        shift = 0
+        while True:
+            byte = file.read(1)
+            if not byte:
+                raise ValueError("Truncated varint")
+            value |= (byte[0] & 0x7f) << shift
+            if not byte[0] & 0x80:
+                return (value >> 1) ^ -(value & 1)
+            shift += 7
+
+    @classmethod
+    def write(cls, path: str, stations: list, metadata: dict = None) -> None:
+        """
+        Write the encoded stations in a dataset file
+        Overwrite the file if already exists. The file is written next to it first and then moved in place,
+        so an interrupted write never leaves a truncated dataset file behind
+
+        :param path:     path where to write the file
+        :param stations: the list of (id, latitude, longitude, series) with series a dictionary
+                         with the gaz id as key and the encoded series as value
+        :param metadata: the data stored in the header of the file, as dictionary (JSON style)
+        """
+        header = json.dumps(metadata or {}).encode()
+
+        buffer = bytearray(cls.MAGIC)
+        cls.encode_varint(cls.FORMAT_VERSION, buffer)
+        cls.encode_varint(len(header), buffer)
+        buffer += header
+        cls.encode_varint(len(stations), buffer)
+
+        for id, latitude, longitude, series in stations:
+            cls.encode_varint(id, buffer)
+            buffer += cls.COORDINATES_FORMAT.pack(latitude, longitude)
+            cls.encode_varint(len(series), buffer)
+            for gaz_id, data in series.items():
+                cls.encode_varint(gaz_id, buffer)
+                cls.encode_varint(len(data), buffer)
+                buffer += data
+
+        temporary_path = path + ".tmp"
+
+        with open(temporary_path, "wb") as file:
+            file.write(buffer)
+
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def read_header(cls, path: str) -> dict:
+        """
+        Read the metadata of a dataset file without reading its stations
+
+        :param path: the dataset file path
+        :return: the metadata or None if the file is missing or not a dataset file of FORMAT_VERSION
+        """
+        try:
+            with open(path, "rb") as file:
+                if file.read(len(cls.MAGIC)) != cls.MAGIC or cls.read_varint(file) != cls.FORMAT_VERSION:
+                    return None
+                metadata = json.loads(file.read(cls.read_varint(file)))
+        except (OSError, ValueError):
+            return None
+
+        return metadata if isinstance(metadata, dict) else None
+
+    @classmethod
+    def read(cls, path: str):
+        """
+        Read the encoded stations of a dataset file
+
+        :param path: the dataset file path
+        :return: a generator of (id, latitude, longitude, series) as given to write
+        :raises ValueError: if the file is not a dataset file of FORMAT_VERSION or is truncated
+        """
+        with open(path, "rb") as file:
+            data = file.read()
+
+        if not data.startswith(cls.MAGIC):
+            raise ValueError("Wrong dataset file format: {path}".format(path=path))
+
+        position = len(cls.MAGIC)
+
+        def read_bytes(length):
+            nonlocal position
+            if position + length > len(data):
+                raise ValueError("Truncated dataset file: {path}".format(path=path))
+            position += length
+            return data[position - length:position]
+
+        def read_varint():
+            value = 0
+            shift = 0
+            while True:
+                byte = read_bytes(1)[0]
+                value |= (byte & 0x7f) << shift
+                if not byte & 0x80:
+                    return (value >> 1) ^ -(value & 1)
+                shift += 7
+
+        if read_varint() != cls.FORMAT_VERSION:
+            raise ValueError("Wrong dataset file version: {path}".format(path=path))
+
+        read_bytes(read_varint())
+
+        for _ in range(read_varint()):
+            id = read_varint()
+            latitude, longitude = cls.COORDINATES_FORMAT.unpack(read_bytes(cls.COORDINATES_FORMAT.size))
+            series = {}
+            for _ in range(read_varint()):
+                gaz_id = read_varint()
+                series[gaz_id] = read_bytes(read_varint())
+            yield id, latitude, longitude, series
+
+        if position != len(data):
+            raise ValueError("Unexpected data at the end of the dataset file: {path}".format(path=path))
@@ -0,0 +1,69 @@
+class GeoHash:
+    """
+    Geohash encoding of a position
+
+    A geohash is a cell of a grid splitting alternatively the longitudes and the latitudes in two,
+    each character of the geohash representing 5 splits.
+    """
+
+    BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+    @classmethod
+    def encode(cls, latitude: float, longitude: float, precision: int) -> str:
+        """
+        Return the geohash of the cell containing the position
+
+        :param latitude:  latitude of the position
+        :param longitude: longitude of the position
+        :param precision: number of characters of the geohash
+        :return: the geohash
+        """
+        latitude_range = [-90.0, 90.0]
+        longitude_range = [-180.0, 180.0]
+        geohash = []
+        bits = 0
+        value = 0
+        even = True
+
+        while len(geohash) < precision:
+            coordinate_range, coordinate = (longitude_range, longitude) if even else (latitude_range, latitude)
+            middle = (coordinate_range[0] + coordinate_range[1]) / 2
+            if coordinate >= middle:
+                value = (value << 1) | 1
+                coordinate_range[0] = middle
+            else:
+                value <<= 1
+                coordinate_range[1] = middle
+            even = not even
+            bits += 1
+            if bits == 5:
+                geohash.append(cls.BASE32[value])
+                bits = 0
+                value = 0
+
+        return "".join(geohash)
+
+    @classmethod
+    def decode_bounds(cls, geohash: str) -> tuple:
+        """
+        Return the boundaries of a geohash cell
+
+        :param geohash: the geohash
+        :return: a tuple (min latitude, max latitude, min longitude, max longitude)
+        """
+        latitude_range = [-90.0, 90.0]
+        longitude_range = [-180.0, 180.0]
+        even = True
+
+        for character in geohash:
+            value = cls.BASE32.index(character)
+            for shift in range(4, -1, -1):
+                coordinate_range = longitude_range if even else latitude_range
+                middle = (coordinate_range[0] + coordinate_range[1]) / 2
+                if (value >> shift) & 1:
+                    coordinate_range[0] = middle
+                else:
+                    coordinate_range[1] = middle
+                even = not even
+
+        return latitude_range[0], latitude_range[1], longitude_range[0], longitude_range[1]
@@ -0,0 +1,484 @@
+from components import Station, Coordinate
+from search_utils.xml_parser_utils import XMLParser
+from search_utils.encoding_utils import PriceEncoder
+from search_utils.io_utils import IOUtils
+
+import calendar
+import datetime
+import logging
+import os
+from array import array
+from functools import lru_cache
+
+
+class PriceDataset:
+    """
+    Columnar representation of the ingested input data
+
+    The stations are stored in the order they appear in the input data.
+    The prices are grouped per station and gaz type and each series is kept
+    compact using PriceEncoder, in the order of the input data.
+
+    Attributes
+    ----------
+    station_ids: array
+        id of each station
+    latitudes: array
+        latitude of each station
+    longitudes: array
+        longitude of each station
+    series: dict
+        (station index, gaz id) as key and the encoded series as value
+    indexes: dict
+        station id as key and the list of the station indexes as value, built on first use
+    """
+
+    __slots__ = "station_ids", "latitudes", "longitudes", "series", "indexes"
+
+    def __init__(self) -> None:
+        self.station_ids = array("q")
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.series = {}
+        self.indexes = None
+
+    def __len__(self) -> int:
+        return len(self.station_ids)
+
+    def add_station(self, id: int, latitude: float, longitude: float, prices: dict) -> None:
+        """
+        Append a station and its price series to the dataset
+
+        :param id:        id of the station
+        :param latitude:  latitude of the station
+        :param longitude: longitude of the station
+        :param prices:    dictionary with the gaz id as key and the list of (timestamp, price) as value
+                          or the already encoded series as value
+        """
+        station_index = len(self.station_ids)
+
+        self.indexes = None
+        self.station_ids.append(id)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+
+        for gaz_id, updates in prices.items():
+            if not isinstance(updates, bytes):
+                updates = PriceEncoder.encode_series(updates=updates)
+            self.series[(station_index, gaz_id)] = updates
+
+    def get_series(self, station_index: int, gaz_id: int):
+        """
+        Stream the prices of a station for a gaz type in the order of the input data
+
+        :param station_index: index of the station inside the dataset
+        :param gaz_id:        id of the gaz type
+        :return: a generator of (timestamp, price), empty if the station does not sell the gaz
+        """
+        return PriceEncoder.decode_series(data=self.series.get((station_index, gaz_id), b""))
+
+    def get_price_at(self, station_index: int, gaz_id: int, timestamp: int) -> float:
+        """
+        Return the price of a station for a gaz type as of the given date
+        The price as of a date is the latest update done before or at this date
+
+        :param station_index: index of the station inside the dataset
+        :param gaz_id:        id of the gaz type
+        :param timestamp:     the date (epoch seconds)
+        :return: the price or None if there was no update before this date
+        """
+        latest_timestamp = None
+        latest_price = None
+
+        for update_timestamp, price in self.get_series(station_index=station_index, gaz_id=gaz_id):
+            if update_timestamp <= timestamp and (latest_timestamp is None or update_timestamp >= latest_timestamp):
+                latest_timestamp = update_timestamp
+                latest_price = price
+
+        return latest_price
+
+    def get_last_price_between(self, station_index: int, gaz_id: int, start: int, end: int) -> float:
+        """
+        Return the last price of a station for a gaz type updated inside a period
+        The last price is the last one in the order of the input data, as the search does
+
+        :param station_index: index of the station inside the dataset
+        :param gaz_id:        id of the gaz type
+        :param start:         start of the period, included (epoch seconds)
+        :param end:           end of the period, excluded (epoch seconds)
+        :return: the price or None if there was no update inside the period
+        """
+        last_price = None
+
+        for update_timestamp, price in self.get_series(station_index=station_index, gaz_id=gaz_id):
+            if start <= update_timestamp < end:
+                last_price = price
+
+        return last_price
+
+    def get_station_indexes(self, station_id: int) -> list:
+        """
+        Return the indexes of all the stations sharing an id, as a station id can be duplicated in the input data
+
+        :param station_id: id of the station
+        :return: the list of the station indexes
+        """
+        if self.indexes is None:
+            indexes = {}
+            for index, id in enumerate(self.station_ids):
+                indexes.setdefault(id, []).append(index)
+            self.indexes = indexes
+
+        return self.indexes.get(station_id, [])
+
+    def get_priced_stations(self, position: tuple, radius: float, distance, gaz_id: int, start: int, end: int) -> list:
+        """
+        Return the stations around a position with a price of a gaz type updated inside a period
+        The stations are resolved as Search.process_data does: when a station id is duplicated,
+        the last station with a price is kept at the place of the first one with a price
+
+        :param position: the position around which the stations are fetched
+        :param radius:   the radius in which the stations must be (in km)
+        :param distance: the function computing the distance between two positions
+        :param gaz_id:   id of the gaz type
+        :param start:    start of the period, included (epoch seconds)
+        :param end:      end of the period, excluded (epoch seconds)
+        :return: a list of (id, (latitude, longitude, price))
+        """
+        indexes = set()
+
+        for index, station_location in enumerate(zip(self.latitudes, self.longitudes)):
+            if distance(position, station_location) <= radius:
+                indexes.update(self.get_station_indexes(station_id=self.station_ids[index]))
+
+        stations = {}
+
+        for index in sorted(indexes):
+            price = self.get_last_price_between(station_index=index, gaz_id=gaz_id, start=start, end=end)
+            if price is not None:
+                stations[self.station_ids[index]] = (self.latitudes[index], self.longitudes[index], price)
+
+        return list(stations.items())
+
+    def save(self, path: str, metadata: dict = None) -> None:
+        """
+        Write the dataset in a compact file
+
+        :param path:     path where to write the file
+        :param metadata: the data stored in the header of the file, as dictionary (JSON style)
+        """
+        stations = [(id, latitude, longitude, {}) for id, latitude, longitude
+                    in zip(self.station_ids, self.latitudes, self.longitudes)]
+
+        for (station_index, gaz_id), data in self.series.items():
+            stations[station_index][3][gaz_id] = data
+
+        PriceEncoder.write(path=path, stations=stations, metadata=metadata)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Read a dataset written with save
+
+        :param path: the dataset file path
+        :return: the dataset
+        """
+        dataset = cls()
+
+        for id, latitude, longitude, series in PriceEncoder.read(path=path):
+            dataset.add_station(id=id, latitude=latitude, longitude=longitude, prices=series)
+
+        return dataset
+
+
+class RejectionReport:
+    """
+    Report of the rows of the input data dropped or flagged during the ingestion
+
+    Attributes
+    ----------
+    MAX_SAMPLES: int
+        Maximum number of station ids kept as sample for each reason
+    stations: int
+        number of stations kept
+    prices: int
+        number of prices kept
+    rejected: dict
+        reason as key and a dictionary with the count and the sample station ids as value
+    flagged: dict
+        same as rejected for the rows kept but looking suspicious
+    """
+
+    MAX_SAMPLES = 10
+
+    def __init__(self) -> None:
+        self.stations = 0
+        self.prices = 0
+        self.rejected = {}
+        self.flagged = {}
+
+    @classmethod
+    def add(cls, reasons: dict, reason: str, id) -> None:
+        """Count a row for a reason and keep its station id as sample"""
+        entry = reasons.setdefault(reason, {"count": 0, "samples": []})
+        entry["count"] += 1
+        if len(entry["samples"]) < cls.MAX_SAMPLES:
+            entry["samples"].append(id)
+
+    def reject(self, reason: str, id) -> None:
+        """Count a row dropped for a reason"""
+        self.add(reasons=self.rejected, reason=reason, id=id)
+
+    def flag(self, reason: str, id) -> None:
+        """Count a row kept but flagged for a reason"""
+        self.add(reasons=self.flagged, reason=reason, id=id)
+
+    def get_rejected_count(self) -> int:
+        """Return the number of rows dropped"""
+        return sum(entry["count"] for entry in self.rejected.values())
+
+    def to_dict(self) -> dict:
+        """Return the report as dictionary (JSON style)"""
+        return {
+            "stations": self.stations,
+            "prices": self.prices,
+            "rejected": self.rejected,
+            "flagged": self.flagged,
+        }
+
+
+class Ingestor:
+    """
+    Class used to load the input data once into a PriceDataset
+
+    The raw attributes are normalized a single time during the ingestion:
+    coordinates to float degrees, update dates to epoch seconds, gaz ids to int and prices to float.
+    The prices are kept as the search reads them, PriceEncoder stores them without loss.
+    The malformed rows are dropped and reported in a RejectionReport.
+    """
+
+    EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+    @staticmethod
+    def to_timestamp(date: datetime) -> int:
+        """Convert a naive datetime to epoch seconds"""
+        return calendar.timegm(date.timetuple())
+
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def parse_day(cls, day: str) -> int:
+        """
+        Convert a date formatted as yyyy-MM-dd to epoch seconds
+        Cached as all the prices of a same day share it
+
+        :param day: the date
+        :return: the epoch seconds of the day at midnight
+        """
+        year, month, day = int(day[0:4]), int(day[5:7]), int(day[8:10])
+        return (datetime.date(year, month, day).toordinal() - cls.EPOCH_ORDINAL) * 86400
+
+    @classmethod
+    def parse_date(cls, value: str) -> int:
+        """
+        Convert an update date formatted as XMLParser.DATE_FORMAT to epoch seconds
+        The usual zero padded dates are parsed directly, the others fall back to strptime
+
+        :param value: the update date
+        :return: the epoch seconds
+        :raises ValueError: if the date does not match XMLParser.DATE_FORMAT
+        """
+        if len(value) == 19 and value[4] == "-" and value[7] == "-" and value[10] == "T" \
+                and value[13] == ":" and value[16] == ":":
+
+            digits = value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19]
+
+            if digits.isascii() and digits.isdigit():
+
+                hour, minute, second = int(value[11:13]), int(value[14:16]), int(value[17:19])
+
+                if hour < 24 and minute < 60 and second < 60:
+                    return cls.parse_day(value[0:10]) + hour * 3600 + minute * 60 + second
+
+        return cls.to_timestamp(datetime.datetime.strptime(value, XMLParser.DATE_FORMAT))
+
+    @classmethod
+    def normalize_station(cls, attrib: dict, report: RejectionReport) -> tuple:
+        """
+        Convert the raw attributes of a station to typed values
+
+        :param attrib: the attributes of the station element
+        :param report: the report where the malformed stations are recorded
+        :return: a tuple (id, latitude, longitude) or None if the station is dropped
+        """
+        raw_id = attrib.get(XMLParser.ID_IDENTIFIER)
+
+        try:
+            id = int(raw_id)
+        except (TypeError, ValueError):
+            report.reject(reason="invalid_station_id", id=raw_id)
+            return None
+
+        lat = attrib.get(XMLParser.LATITUDE_IDENTIFIER, "")
+        lon = attrib.get(XMLParser.LONGITUDE_IDENTIFIER, "")
+
+        if not (Station.validate_coordonate(coordonate=lat) and Station.validate_coordonate(coordonate=lon)):
+            report.reject(reason="invalid_coordinates", id=id)
+            return None
+
+        try:
+            latitude = Station.format_coordonate(coordonate=lat)
+            longitude = Station.format_coordonate(coordonate=lon)
+        except ValueError:
+            report.reject(reason="invalid_coordinates", id=id)
+            return None
+
+        if not (Coordinate.MIN_VALUE_LATITUDE <= latitude <= Coordinate.MAX_VALUE_LATITUDE
+                and Coordinate.MIN_VALUE_LONGITUDE <= longitude <= Coordinate.MAX_VALUE_LONGITUDE):
+            report.flag(reason="coordinates_out_of_range", id=id)
+
+        return id, latitude, longitude
+
+    @classmethod
+    def normalize_price(cls, attrib: dict, station_id: int, report: RejectionReport) -> tuple:
+        """
+        Convert the raw attributes of a price to typed values
+        A price without update date is dropped silently as the search never uses it
+
+        :param attrib:     the attributes of the price element
+        :param station_id: id of the station of the price, used in the report
+        :param report:     the report where the malformed prices are recorded
+        :return: a tuple (gaz id, timestamp, price) or None if the price is dropped
+        """
+        update = attrib.get(XMLParser.UPDATE_IDENTIFIER)
+
+        if not update:
+            return None
+
+        try:
+            timestamp = cls.parse_date(value=update)
+        except ValueError:
+            report.reject(reason="invalid_date", id=station_id)
+            return None
+
+        try:
+            gaz_id = int(attrib[XMLParser.ID_IDENTIFIER])
+        except (KeyError, ValueError):
+            report.reject(reason="invalid_gaz_id", id=station_id)
+            return None
+
+        try:
+            price = float(attrib[XMLParser.PRICE_VALUE_IDENTIFIER])
+        except (KeyError, ValueError):
+            report.reject(reason="invalid_price", id=station_id)
+            return None
+
+        return gaz_id, timestamp, price
+
+    @classmethod
+    def ingest(cls, data, report: RejectionReport = None) -> PriceDataset:
+        """
+        Process the rows of the input data, normalize them and store the stations and their prices in columns
+        Stations with wrong coordinates are not stored as they can never be part of a search result,
+        their prices are reported as station_rejected and the prices outside of any station as price_without_station
+
+        :param data:   the streamed input data
+        :param report: the report where the dropped rows are recorded
+        :return: the dataset containing all the stations and their prices
+        """
+        dataset = PriceDataset()
+        report = report if report is not None else RejectionReport()
+
+        current_station = None
+        current_prices = None
+        current_id = None
+
+        for event, element in data:
+
+            if event == XMLParser.START_EVENT and element.tag == XMLParser.STATION_IDENTIFIER:
+
+                if current_station is not None:
+                    dataset.add_station(*current_station, prices=current_prices)
+
+                current_station = cls.normalize_station(attrib=element.attrib, report=report)
+                current_prices = {}
+                current_id = element.attrib.get(XMLParser.ID_IDENTIFIER)
+
+                try:
+                    current_id = int(current_id)
+                except (TypeError, ValueError):
+                    pass
+
+            if event == XMLParser.START_EVENT and element.tag == XMLParser.PRICE_IDENTIFIER:
+
+                if current_prices is None:
+                    report.reject(reason="price_without_station", id=None)
+
+                elif current_station is None:
+                    report.reject(reason="station_rejected", id=current_id)
+
+                else:
+                    price = cls.normalize_price(attrib=element.attrib, station_id=current_station[0], report=report)
+
+                    if price is not None:
+                        gaz_id, timestamp, value = price
+                        current_prices.setdefault(gaz_id, []).append((timestamp, value))
+                        report.prices += 1
+
+            element.clear()
+
+        if current_station is not None:
+            dataset.add_station(*current_station, prices=current_prices)
+
+        report.stations = len(dataset)
+
+        if report.get_rejected_count():
+            logging.warning("{count} rows rejected during the ingestion".format(count=report.get_rejected_count()))
+
+        return dataset
+
+    @classmethod
+    def load(cls, ressources_path: str, dataset_path: str, report_path: str) -> PriceDataset:
+        """
+        Return the dataset stored in the dataset file
+        The dataset file is reused only if it was written with the current PriceEncoder.FORMAT_VERSION
+        from an XML file of the same size and modification time, or if the XML file is missing.
+        Otherwise, or if the dataset file cannot be read, the input data are ingested again
+        and the dataset file is rewritten.
+        The rejection report is always written, from the header of the dataset file when it is reused.
+
+        :param ressources_path: the XML path
+        :param dataset_path:    the dataset file path
+        :param report_path:     the rejection report path
+        :return: the dataset
+        """
+        metadata = PriceEncoder.read_header(path=dataset_path)
+        source = os.stat(ressources_path) if os.path.exists(ressources_path) else None
+
+        if metadata is None:
+            reusable = False
+        elif source is None:
+            logging.warning("{path} not found, reusing {dataset}".format(path=ressources_path, dataset=dataset_path))
+            reusable = True
+        else:
+            reusable = (metadata.get("source_size"), metadata.get("source_mtime_ns")) == \
+                (source.st_size, source.st_mtime_ns)
+
+        dataset = None
+
+        if reusable:
+            try:
+                dataset = PriceDataset.load(path=dataset_path)
+                report = metadata.get("report", {})
+            except ValueError as error:
+                logging.warning("{error}, ingesting {path} again".format(error=error, path=ressources_path))
+
+        if dataset is None:
+            rejection_report = RejectionReport()
+            dataset = cls.ingest(data=XMLParser.load_data(path=ressources_path), report=rejection_report)
+            report = rejection_report.to_dict()
+            dataset.save(path=dataset_path, metadata={"source_size": source.st_size,
+                                                      "source_mtime_ns": source.st_mtime_ns,
+                                                      "report": report})
+
+        IOUtils.json_writer(path=report_path, data=report)
+        return dataset
@@ -0,0 +1,232 @@
+from components import User, Gaz, Coordinate
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SearchService:
+    """
+    Asyncio front-end serving the search over HTTP
+
+    Concurrent identical requests are coalesced into a single computation.
+    The searches run on a bounded executor so the event loop stays responsive, and
+    when too many computations are pending the new requests are answered 503 right away.
+
+    The executor is a thread pool: under the GIL the searches are interleaved, not run in parallel on several cores,
+    so max_workers bounds the number of searches in progress and the memory they use, not the CPU they get.
+    What it guarantees is that the event loop keeps accepting, coalescing, rejecting and answering the requests
+    while a search runs, and that a slow search does not delay the answer of the searches already done.
+
+    Attributes
+    ----------
+    LATENCY_WINDOW: int
+        Number of the latest requests used to compute the latency percentiles
+    DATE_FORMAT: str
+        Format of the date parameter
+    REASONS: dict
+        Reason phrase of the HTTP status codes answered
+    """
+
+    LATENCY_WINDOW = 1000
+    DATE_FORMAT = "%Y-%m-%d"
+    REASONS = {
+        200: "OK",
+        400: "Bad Request",
+        404: "Not Found",
+        405: "Method Not Allowed",
+        500: "Internal Server Error",
+        503: "Service Unavailable",
+    }
+
+    def __init__(self, search, max_workers: int = 4, max_pending: int = 32, get_cache_counters=None) -> None:
+        """
+        :param search:             the function computing the output of a request from the user and the gaz type
+        :param max_workers:        number of threads running the searches
+        :param max_pending:        number of computations queued or running above which the requests are rejected
+        :param get_cache_counters: the function returning the counters of the cache used by the search, if any,
+                                   added to the metrics with the cache_ prefix
+        """
+        self.search = search
+        self.get_cache_counters = get_cache_counters
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_pending = max_pending
+        self.in_flight = {}
+        self.latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self.requests = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    @staticmethod
+    def get_key(user: User, gaz: Gaz) -> tuple:
+        """Return the key identifying the identical requests"""
+        return user.latitude, user.longitude, user.radius, user.date, gaz.gaz_type
+
+    def get_latency(self, percentile: float) -> float:
+        """
+        Return a percentile of the latest latencies using the nearest rank
+
+        :param percentile: the percentile to compute, between 0 and 1
+        :return: the latency (in ms) or None if no request was answered yet
+        """
+        if not self.latencies:
+            return None
+
+        latencies = sorted(self.latencies)
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * percentile))] * 1000, 3)
+
+    def get_metrics(self) -> dict:
+        """Return the request counters, the queue depth, the latency percentiles and the cache counters"""
+        metrics = {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "queue_depth": len(self.in_flight),
+            "p50_ms": self.get_latency(percentile=0.5),
+            "p99_ms": self.get_latency(percentile=0.99),
+        }
+
+        if self.get_cache_counters is not None:
+            for name, value in self.get_cache_counters().items():
+                metrics["cache_" + name] = value
+
+        return metrics
+
+    async def submit(self, user: User, gaz: Gaz) -> tuple:
+        """
+        Compute the output of a request, joining the identical computation if one is already in flight
+
+        :param user: the user attributes requesting the stations
+        :param gaz:  the gaz type requested by the user
+        :return: a tuple (HTTP status, body)
+        """
+        start_time = time.perf_counter()
+        self.requests += 1
+
+        key = self.get_key(user=user, gaz=gaz)
+        future = self.in_flight.get(key)
+
+        if future is not None:
+            self.coalesced += 1
+
+        elif len(self.in_flight) >= self.max_pending:
+            self.rejected += 1
+            return 503, {"error": "Too many pending requests, retry later"}
+
+        else:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.search, user, gaz)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+        try:
+            result = await asyncio.shield(future)
+        except Exception:
+            logging.exception("Search failed for {key}".format(key=key))
+            return 500, {"error": "Search failed"}
+
+        self.latencies.append(time.perf_counter() - start_time)
+        return 200, result
+
+    @classmethod
+    def parse_request(cls, query: str) -> tuple:
+        """
+        Validate the parameters of a search request
+
+        :param query: the query string of the request
+        :return: a tuple (user, gaz)
+        :raises ValueError: if a parameter is missing or wrong
+        """
+        params = {name: values[-1] for name, values in urllib.parse.parse_qs(query).items()}
+
+        try:
+            gaz_type = params["gaz_type"]
+            if gaz_type not in Gaz.GAZ_MAPPING:
+                raise ValueError("Unknown gaz type: {}".format(gaz_type))
+
+            user = User(latitude=Coordinate.validate_latitude(params["latitude"]),
+                        longitude=Coordinate.validate_longitude(params["longitude"]),
+                        radius=float(params["radius"]),
+                        date=datetime.datetime.strptime(params["date"], cls.DATE_FORMAT),
+                        gaz_type=gaz_type)
+
+        except KeyError as error:
+            raise ValueError("Missing parameter: {}".format(error.args[0]))
+        except argparse.ArgumentTypeError as error:
+            raise ValueError(str(error))
+
+        return user, Gaz(gaz_type=gaz_type)
+
+    async def get_response(self, reader: asyncio.StreamReader) -> tuple:
+        """
+        Read an HTTP request and compute its response: /search with the search parameters or /metrics
+
+        :param reader: the stream of the request
+        :return: a tuple (HTTP status, body)
+        """
+        request_line = (await reader.readline()).decode("latin-1")
+
+        while (await reader.readline()).strip():
+            pass
+
+        try:
+            method, target, _ = request_line.split(" ", 2)
+            url = urllib.parse.urlsplit(target)
+
+            if method != "GET":
+                return 405, {"error": "Method not allowed"}
+            if url.path == "/metrics":
+                return 200, self.get_metrics()
+            if url.path == "/search":
+                user, gaz = self.parse_request(query=url.query)
+                return await self.submit(user=user, gaz=gaz)
+
+        except ValueError as error:
+            return 400, {"error": str(error)}
+
+        return 404, {"error": "Not found"}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer an HTTP request
+        The unexpected errors are answered 500 and the connection is closed in every case,
+        a client disconnecting before the response is ignored
+        """
+        try:
+            try:
+                status, body = await self.get_response(reader=reader)
+            except ConnectionError:
+                return
+            except Exception:
+                logging.exception("Request failed")
+                status, body = 500, {"error": "Internal server error"}
+
+            data = json.dumps(body).encode()
+            head = "HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {length}\r\n" \
+                   "Connection: close\r\n\r\n".format(status=status, reason=self.REASONS[status], length=len(data))
+            writer.write(head.encode() + data)
+            await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, host: str, port: int) -> None:
+        """Listen for the HTTP requests until cancelled"""
+        server = await asyncio.start_server(self.handle, host=host, port=port)
+
+        logging.warning("--- serving on {host}:{port} ---".format(host=host, port=port))
+
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,199 @@
+from components import User, Gaz
+from search_utils.ingest_utils import Ingestor, PriceDataset
+from search_utils.io_utils import IOUtils
+
+import datetime
+import logging
+import math
+import time
+from haversine import haversine
+
+
+class Stats:
+    """
+    Class used to compute the price statistics of an area over a range of days
+
+    For each day, the price of a station is the one a search for that day would return:
+    the last price of the requested gaz updated during that day.
+
+    Attributes
+    ----------
+    SECONDS_PER_DAY: int
+        Number of seconds in a day, used to group the prices by day
+    PERCENTILE: float
+        Percentile reported alongside the median and the mean
+    HAVERSINE: Haversine
+        Used to compute haversine distance
+    """
+
+    SECONDS_PER_DAY = 86400
+    PERCENTILE = 0.9
+    HAVERSINE = haversine.Haversine()
+
+    @classmethod
+    def get_area_stations(cls, user: User, dataset: PriceDataset) -> list:
+        """
+        Keep the index of the stations located in the user area
+
+        :param user:    the user attributes requesting the statistics
+        :param dataset: the ingested data
+        :return: the list of the station indexes inside the user area
+        """
+        user_location = user.get_position()
+        distance = cls.HAVERSINE.distance
+
+        return [index for index, station_location in enumerate(zip(dataset.latitudes, dataset.longitudes))
+                if distance(user_location, station_location) <= user.radius]
+
+    @classmethod
+    def get_daily_prices(cls, dataset: PriceDataset, stations: list, requested_gaz: Gaz,
+                         first_day: int, last_day: int) -> list:
+        """
+        Group the prices of the stations by day
+        When a station has several prices the same day, the last one is kept.
+        When a station id is duplicated in the input data, the last station with a price that day is kept,
+        as the search does, even if it is outside of the user area.
+
+        :param dataset:       the ingested data
+        :param stations:      the indexes of the stations to use
+        :param requested_gaz: the gaz type requested by the user
+        :param first_day:     first day of the range (days since epoch)
+        :param last_day:      last day of the range, included (days since epoch)
+        :return: a list with one dictionary per day, station id as key and price as value
+        """
+        days = [{} for _ in range(last_day - first_day + 1)]
+        area = set(stations)
+
+        indexes = set()
+        for station_index in stations:
+            indexes.update(dataset.get_station_indexes(station_id=dataset.station_ids[station_index]))
+
+        for station_index in sorted(indexes):
+
+            station_id = dataset.station_ids[station_index]
+            for timestamp, price in dataset.get_series(station_index=station_index, gaz_id=requested_gaz.id):
+
+                day = timestamp // cls.SECONDS_PER_DAY - first_day
+
+                if 0 <= day < len(days):
+                    days[day][station_id] = (station_index, price)
+
+        return [{station_id: price for station_id, (station_index, price) in prices.items() if station_index in area}
+                for prices in days]
+
+    @classmethod
+    def get_percentile(cls, prices: list, percentile: float) -> float:
+        """
+        Compute a percentile of sorted prices using a linear interpolation between the closest ranks
+
+        :param prices:     the sorted list of prices
+        :param percentile: the percentile to compute, between 0 and 1
+        :return: the percentile value
+        """
+        rank = (len(prices) - 1) * percentile
+        lower = math.floor(rank)
+        upper = math.ceil(rank)
+        return prices[lower] + (prices[upper] - prices[lower]) * (rank - lower)
+
+    @classmethod
+    def aggregate(cls, prices: list) -> dict:
+        """
+        Compute the statistics of the prices of a day
+
+        :param prices: the prices of the stations for the day
+        :return: the statistics as dictionary, the values are None when there is no price
+        """
+        if not prices:
+            return {"count": 0, "min": None, "median": None, "mean": None, "p90": None}
+
+        prices = sorted(prices)
+
+        return {
+            "count": len(prices),
+            "min": prices[0],
+            "median": round(cls.get_percentile(prices=prices, percentile=0.5), 4),
+            "mean": round(math.fsum(prices) / len(prices), 4),
+            "p90": round(cls.get_percentile(prices=prices, percentile=cls.PERCENTILE), 4),
+        }
+
+    @classmethod
+    def compute(cls, user: User, requested_gaz: Gaz, dataset: PriceDataset, end_date: datetime) -> list:
+        """
+        Compute the statistics of the user area for each day between the user date and the end date
+
+        :param user:          the user attributes requesting the statistics
+        :param requested_gaz: the gaz type requested by the user
+        :param dataset:       the ingested data
+        :param end_date:      last day of the range, included
+        :return: the list of the statistics per day
+        :raises ValueError: if the end date is before the user date
+        """
+        if end_date < user.date:
+            raise ValueError("End date {end} is before the date {start}".format(
+                end=end_date.date().isoformat(), start=user.date.date().isoformat()))
+
+        first_day = Ingestor.to_timestamp(user.date) // cls.SECONDS_PER_DAY
+        last_day = Ingestor.to_timestamp(end_date) // cls.SECONDS_PER_DAY
+
+        stations = cls.get_area_stations(user=user, dataset=dataset)
+        days = cls.get_daily_prices(dataset=dataset, stations=stations, requested_gaz=requested_gaz,
+                                    first_day=first_day, last_day=last_day)
+
+        result = []
+
+        for offset, prices in enumerate(days):
+            date = user.date.date() + datetime.timedelta(days=offset)
+            result.append({"date": date.isoformat(), **cls.aggregate(prices=list(prices.values()))})
+
+        return result
+
+    @classmethod
+    def format_output(cls, gaz: Gaz, days: list) -> dict:
+        """
+        Prepare the statistics in the right format to write them in JSON later.
+
+        :param gaz:  the gaz type requested by the user
+        :param days: the list of the statistics per day
+        :return: the data formatted as dictionary (JSON style)
+        """
+        return {
+            "name": gaz.gaz_type,
+            "days": days,
+        }
+
+    @classmethod
+    def run(cls, args, ressources_path: str, dataset_path: str, report_path: str, output_path: str):
+        """Execute the computation of the price statistics matching the user request"""
+
+        load_start_time = time.time()
+
+        user = User(latitude=args.latitude, longitude=args.longitude, radius=args.radius,
+                    date=args.date, gaz_type=args.gaz_type)
+
+        gaz = Gaz(gaz_type=args.gaz_type)
+
+        dataset = Ingestor.load(ressources_path=ressources_path, dataset_path=dataset_path, report_path=report_path)
+
+        execution_time = (time.time() - load_start_time) * 1000
+        logging.warning("--- {time} ms for data loading---".format(time=execution_time))
+
+        stats_start_time = time.time()
+
+        days = cls.compute(user=user, requested_gaz=gaz, dataset=dataset, end_date=args.end_date or args.date)
+
+        execution_time = (time.time() - stats_start_time) * 1000
+        logging.warning("--- {time} ms for stats---".format(time=execution_time))
+
+        result = cls.format_output(gaz=gaz, days=days)
+
+        IOUtils.json_writer(path=output_path, data=result)
+
+    @staticmethod
+    def main(args):
+        ressources_path = "ressources/oil_data/PrixCarburants_annuel_2022.xml"
+        dataset_path = "ressources/oil_data/PrixCarburants_annuel_2022.gsf"
+        report_path = "outputs/rejections.json"
+        output_path = "outputs/stats.json"
+
+        Stats.run(args=args, ressources_path=ressources_path, dataset_path=dataset_path,
+                  report_path=report_path, output_path=output_path)
@@ -0,0 +1,395 @@
+from search.search import Search, SearchCache
+from search.stats import Stats
+from search.search_utils.ingest_utils import Ingestor, PriceDataset
+from search.search_utils.xml_parser_utils import XMLParser
+from search.components import User, Station, Gaz
+
+import argparse
+import copy
+import datetime
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+
+class DatasetGenerator:
+    """
+    Generate randomized input data and queries covering the edge cases of the search:
+      - ties on price, and on price and distance with stations sharing the same position
+      - radius equal to the distance of a station
+      - malformed coordinates the search skips
+      - stations without price, without price for the requested gaz or the requested date
+      - several updates the same day, not sorted by date, and prices without update date
+      - station ids duplicated in the input data
+      - prices with more than 3 decimals, integer prices and the same price written differently
+      - groups of near-duplicate queries sharing the radius, the date and the gaz type, a few hundred meters apart,
+        so the cache answers most of them from the candidates fetched for another query of the group
+
+    Only inputs the reference search accepts are generated, as it stops on the other malformed rows.
+
+    Attributes
+    ----------
+    CENTER: tuple
+        position around which the stations are generated
+    DATE: datetime
+        date around which the prices are generated
+    PRICES: list
+        prices used for the stations, few of them to have ties, not all of them a whole number of millis
+    MALFORMED_COORDINATES: list
+        coordinates rejected by Station.validate_coordonate
+    RADIUSES: list
+        radiuses used for the queries (in meter)
+    GROUP_SIZE: int
+        maximum number of queries of a group of near-duplicate queries
+    GROUP_SPREAD: float
+        maximum offset of the queries of a group from its first query (in degree, ~300 m)
+    """
+
+    CENTER = (48.8319929, 2.3245488)
+    DATE = datetime.datetime(year=2022, month=2, day=21)
+    PRICES = ["1.899", "1.8990", "1.901", "1.905", "1.911", "2.001", "1.8815", "1.90125", "1.9", "2"]
+    MALFORMED_COORDINATES = ["", "48e5", "abc", "-"]
+    RADIUSES = [500, 2000, 5000, 15000]
+    GROUP_SIZE = 6
+    GROUP_SPREAD = 0.003
+
+    def __init__(self, seed: int) -> None:
+        self.random = random.Random(seed)
+
+    def get_coordinate(self, value: float) -> str:
+        """Return a coordinate formatted as in the input data, sometimes with decimals"""
+        coordinate = value * 100000
+        return str(round(coordinate, 1)) if self.random.random() < 0.2 else str(round(coordinate))
+
+    def get_prices(self) -> list:
+        """Return the price elements of a station"""
+        prices = []
+
+        for gaz_type, gaz_id in self.random.sample(sorted(Gaz.GAZ_MAPPING.items()), self.random.randint(0, 4)):
+            for _ in range(self.random.randint(1, 4)):
+                date = self.DATE + datetime.timedelta(days=self.random.randint(-1, 1),
+                                                      seconds=self.random.randint(0, 86399))
+                update = '' if self.random.random() < 0.05 else ' maj="{}"'.format(
+                    date.strftime(XMLParser.DATE_FORMAT))
+                prices.append('<prix nom="{}" id="{}"{} valeur="{}"/>'.format(
+                    gaz_type, gaz_id, update, self.random.choice(self.PRICES)))
+
+        return prices
+
+    def write(self, path: str, size: int) -> list:
+        """
+        Write randomized input data
+
+        :param path: path where to write the file
+        :param size: number of stations
+        :return: the list of (latitude, longitude) of the stations with valid coordinates
+        """
+        rows = ['<?xml version="1.0" encoding="UTF-8"?>', "<pdv_liste>"]
+        positions = []
+
+        for index in range(size):
+
+            station_id = 1000 + (self.random.randrange(index) if index and self.random.random() < 0.1 else index)
+
+            if positions and self.random.random() < 0.1:
+                latitude, longitude = self.random.choice(positions)
+            else:
+                latitude = self.get_coordinate(self.CENTER[0] + self.random.uniform(-0.15, 0.15))
+                longitude = self.get_coordinate(self.CENTER[1] + self.random.uniform(-0.2, 0.2))
+
+            if self.random.random() < 0.05:
+                latitude = self.random.choice(self.MALFORMED_COORDINATES)
+            else:
+                positions.append((latitude, longitude))
+
+            rows.append('<pdv id="{}" latitude="{}" longitude="{}" cp="75014" pop="R">'.format(
+                station_id, latitude, longitude))
+            rows.append("<adresse>1 rue de la Gare</adresse><ville>Paris</ville>")
+            rows.extend(self.get_prices())
+            rows.append("</pdv>")
+
+        rows.append("</pdv_liste>")
+
+        with open(path, "w") as file:
+            file.write("\n".join(rows))
+
+        return [(Station.format_coordonate(latitude), Station.format_coordonate(longitude))
+                for latitude, longitude in positions]
+
+    def get_queries(self, positions: list, count: int):
+        """
+        Generate randomized groups of near-duplicate queries around the center
+        The queries of a group share the radius, the date and the gaz type. The radius is sometimes the distance
+        from the first query of the group to a station, and some queries of the group repeat its position,
+        so the boundary radius is also checked when answered from the cache
+
+        :param positions: the positions of the stations with valid coordinates
+        :param count:     number of queries
+        :return: a generator of (user, gaz)
+        """
+        generated = 0
+
+        while generated < count:
+
+            gaz_type = self.random.choice(sorted(Gaz.GAZ_MAPPING))
+            latitude = self.CENTER[0] + self.random.uniform(-0.01, 0.01)
+            longitude = self.CENTER[1] + self.random.uniform(-0.01, 0.01)
+            radius = self.random.choice(self.RADIUSES)
+            date = self.DATE + datetime.timedelta(days=self.random.randint(-1, 1))
+
+            boundary = None
+            if positions and self.random.random() < 0.3:
+                boundary = Search.HAVERSINE.distance((latitude, longitude), self.random.choice(positions))
+
+            for member in range(min(self.random.randint(1, self.GROUP_SIZE), count - generated)):
+
+                offset = (0, 0) if member == 0 or self.random.random() < 0.2 else (
+                    self.random.uniform(-self.GROUP_SPREAD, self.GROUP_SPREAD),
+                    self.random.uniform(-self.GROUP_SPREAD, self.GROUP_SPREAD))
+
+                user = User(latitude=latitude + offset[0], longitude=longitude + offset[1], radius=radius,
+                            date=date, gaz_type=gaz_type)
+
+                if boundary is not None:
+                    user.radius = boundary
+
+                generated += 1
+                yield user, Gaz(gaz_type=gaz_type)
+
+
+class DifferentialHarness:
+    """
+    Check the alternative execution paths return exactly what the reference search returns
+
+    The reference is Search.process_data -> Search.find_stations -> Search.format_output over the input data.
+    The reference statistics run Search.process_data for each day of the range and aggregate the prices
+    of the eligible stations with the statistics module, so both the stations selected by Stats
+    and its aggregation are checked day by day. The rounded statistics are compared to the exact
+    reference values within the rounding error, every other value must be equal.
+    Every path runs on the same randomized queries, the outputs are compared to the reference
+    and the time spent by each path is recorded to report the speedups side by side.
+
+    Attributes
+    ----------
+    PATHS: dict
+        name of the path as key and a tuple (function computing the output, reference view to compare to) as value
+    REFERENCES: dict
+        reference view as key and the name of its timings as value
+    STATS_DAYS: int
+        maximum number of days of the statistics ranges, the queries cycle through 1 to STATS_DAYS days
+    ROUNDED_STATS: tuple
+        statistics rounded by Stats
+    ROUNDING_ERROR: float
+        maximum difference between a rounded statistic and its exact value
+    """
+
+    PATHS = {
+        "dataset": (lambda context, user, gaz: Search.format_output(gaz=gaz, stations=Search.find_stations(
+            user=user, stations=Search.process_dataset(dataset=context["dataset"], user=user, requested_gaz=gaz))),
+            "search"),
+        "dataset_file": (lambda context, user, gaz: Search.format_output(gaz=gaz, stations=Search.find_stations(
+            user=user, stations=Search.process_dataset(dataset=context["loaded"], user=user, requested_gaz=gaz))),
+            "search"),
+        "cache": (lambda context, user, gaz: Search.format_output(gaz=gaz, stations=context["cache"].find_stations(
+            user=user, requested_gaz=gaz)), "search"),
+        "stats": (lambda context, user, gaz: Stats.compute(
+            user=user, requested_gaz=gaz, dataset=context["dataset"], end_date=context["end_date"]), "stats"),
+    }
+    REFERENCES = {"search": "reference", "stats": "reference_stats"}
+    STATS_DAYS = 3
+    ROUNDED_STATS = ("median", "mean", "p90")
+    ROUNDING_ERROR = 0.5e-4 + 1e-12
+
+    def __init__(self, tmp_dir: str) -> None:
+        self.tmp_dir = tmp_dir
+        self.timings = {}
+        self.mismatches = []
+        self.cache_counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def measure(self, name: str, function):
+        """Call the function and record the time it took for the given path"""
+        start = time.perf_counter()
+        result = function()
+        self.timings.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    @staticmethod
+    def get_reference_search(path: str, user: User, gaz: Gaz) -> dict:
+        """
+        Compute the reference output of a search
+
+        :param path: the input data path
+        :param user: the user attributes requesting the stations
+        :param gaz:  the gaz type requested by the user
+        :return: the output of the search
+        """
+        stations = Search.process_data(data=XMLParser.load_data(path=path), user=user, requested_gaz=gaz)
+        return Search.format_output(gaz=gaz, stations=Search.find_stations(user=user, stations=stations))
+
+    @staticmethod
+    def aggregate(prices: list) -> dict:
+        """
+        Compute the exact reference statistics of the prices of a day with the statistics module
+
+        :param prices: the prices of the eligible stations
+        :return: the statistics as dictionary, the values are None when there is no price
+        """
+        if not prices:
+            return {"count": 0, "min": None, "median": None, "mean": None, "p90": None}
+
+        return {
+            "count": len(prices),
+            "min": min(prices),
+            "median": statistics.median(prices),
+            "mean": statistics.fmean(prices),
+            "p90": statistics.quantiles(prices, n=10, method="inclusive")[-1] if len(prices) > 1 else prices[0],
+        }
+
+    @classmethod
+    def matches(cls, view: str, result, expected) -> bool:
+        """
+        Compare the output of a path to its reference
+
+        :param view:     the reference view
+        :param result:   the output of the path
+        :param expected: the reference output
+        :return: True if the output matches the reference
+        """
+        if view != "stats":
+            return result == expected
+
+        if len(result) != len(expected):
+            return False
+
+        for day, expected_day in zip(result, expected):
+            if day.keys() != expected_day.keys():
+                return False
+            for key, value in day.items():
+                if key in cls.ROUNDED_STATS and value is not None and expected_day[key] is not None:
+                    if not math.isclose(value, expected_day[key], rel_tol=0, abs_tol=cls.ROUNDING_ERROR):
+                        return False
+                elif value != expected_day[key]:
+                    return False
+
+        return True
+
+    @staticmethod
+    def get_reference_stats(path: str, user: User, gaz: Gaz, end_date: datetime) -> list:
+        """
+        Compute the reference statistics of a range of days, running the reference search for each day
+
+        :param path:     the input data path
+        :param user:     the user attributes requesting the statistics
+        :param gaz:      the gaz type requested by the user
+        :param end_date: last day of the range, included
+        :return: the list of the statistics per day
+        """
+        days = []
+        day_user = copy.copy(user)
+
+        while day_user.date <= end_date:
+            stations = Search.process_data(data=XMLParser.load_data(path=path), user=day_user, requested_gaz=gaz)
+            prices = [station.price for _, station in Search.get_eligible_stations(user=day_user, stations=stations)]
+            days.append({"date": day_user.date.date().isoformat(), **DifferentialHarness.aggregate(prices=prices)})
+            day_user.date += datetime.timedelta(days=1)
+
+        return days
+
+    def run(self, seed: int, size: int = 200, queries: int = 30) -> None:
+        """
+        Generate a randomized input data and run the queries through every path
+
+        :param seed:    seed of the randomized input data and queries
+        :param size:    number of stations of the input data
+        :param queries: number of queries
+        """
+        generator = DatasetGenerator(seed=seed)
+        path = os.path.join(self.tmp_dir, "data_{}.xml".format(seed))
+        dataset_path = os.path.join(self.tmp_dir, "data_{}.gsf".format(seed))
+
+        positions = generator.write(path=path, size=size)
+
+        dataset = self.measure("ingest", lambda: Ingestor.ingest(data=XMLParser.load_data(path=path)))
+        dataset.save(path=dataset_path)
+        context = {
+            "dataset": dataset,
+            "loaded": self.measure("load", lambda: PriceDataset.load(path=dataset_path)),
+            "cache": SearchCache(dataset=dataset),
+        }
+
+        for index, (user, gaz) in enumerate(generator.get_queries(positions=positions, count=queries)):
+
+            context["end_date"] = user.date + datetime.timedelta(days=index % self.STATS_DAYS)
+            reference = {
+                "search": self.measure(self.REFERENCES["search"], lambda: self.get_reference_search(
+                    path=path, user=user, gaz=gaz)),
+                "stats": self.measure(self.REFERENCES["stats"], lambda: self.get_reference_stats(
+                    path=path, user=user, gaz=gaz, end_date=context["end_date"])),
+            }
+
+            for name, (function, view) in self.PATHS.items():
+
+                result = self.measure(name, lambda: function(context, user, gaz))
+
+                if not self.matches(view=view, result=result, expected=reference[view]):
+                    self.mismatches.append({
+                        "seed": seed,
+                        "path": name,
+                        "query": (user.latitude, user.longitude, user.radius, user.date.isoformat(),
+                                  context["end_date"].isoformat(), gaz.gaz_type),
+                        "expected": reference[view],
+                        "result": result,
+                    })
+
+        for name, value in context["cache"].get_counters().items():
+            if name in self.cache_counters:
+                self.cache_counters[name] += value
+
+    def format_report(self) -> str:
+        """Return the timings of every path side by side with their speedup against its reference"""
+        references = {view: sum(self.timings.get(name, [])) / max(len(self.timings.get(name, [])), 1)
+                      for view, name in self.REFERENCES.items()}
+        lines = ["{:<14}{:>8}{:>12}{:>12}{:>10}{:>12}".format("path", "calls", "total ms", "mean ms",
+                                                              "speedup", "mismatches")]
+
+        for name, timings in self.timings.items():
+            mean = sum(timings) / len(timings)
+            speedup = "{:.1f}x".format(references[self.PATHS[name][1]] / mean) if name in self.PATHS and mean else ""
+            mismatches = sum(1 for mismatch in self.mismatches if mismatch["path"] == name)
+            lines.append("{:<14}{:>8}{:>12.2f}{:>12.3f}{:>10}{:>12}".format(
+                name, len(timings), sum(timings) * 1000, mean * 1000, speedup, mismatches))
+
+        lines.append("cache: {hits} hits, {misses} misses, {evictions} evictions".format(**self.cache_counters))
+
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(prog='DifferentialHarness',
+                                     description='Check the fast paths against the reference search and report '
+                                                 'their timings')
+    parser.add_argument('--seeds', help='Number of randomized input data', type=int, default=8)
+    parser.add_argument('--size', help='Number of stations of each input data', type=int, default=200)
+    parser.add_argument('--queries', help='Number of queries run on each input data', type=int, default=30)
+    args = parser.parse_args()
+
+    # the reference search logs every malformed station on every query
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        harness = DifferentialHarness(tmp_dir=tmp_dir)
+        for seed in range(args.seeds):
+            harness.run(seed=seed, size=args.size, queries=args.queries)
+
+    print(harness.format_report())
+
+    for mismatch in harness.mismatches:
+        print(mismatch)
+
+    sys.exit(1 if harness.mismatches else 0)
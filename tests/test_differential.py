@@ -0,0 +1,43 @@
+from differential_harness import DifferentialHarness, DatasetGenerator
+
+import pytest
+
+
+class TestDifferential:
+
+    @pytest.mark.parametrize("seed", range(8))
+    def test_paths_match_reference(self, seed, tmp_path):
+        """Test every alternative path returns the reference output on randomized input data and queries"""
+
+        harness = DifferentialHarness(tmp_dir=str(tmp_path))
+        harness.run(seed=seed)
+
+        assert harness.mismatches == []
+        assert len(harness.timings["reference"]) == 30
+        assert harness.cache_counters["hits"] >= 10
+
+    def test_generator_edge_cases(self, tmp_path):
+        """Test the generated input data contain the edge cases the harness is meant to cover"""
+
+        generator = DatasetGenerator(seed=0)
+        path = str(tmp_path / "data.xml")
+        positions = generator.write(path=path, size=200)
+
+        with open(path) as file:
+            data = file.read()
+
+        assert 'latitude=""' in data or "48e5" in data or "abc" in data
+        assert len(set(positions)) < len(positions)
+        assert 'valeur="1.8815"' in data and 'valeur="2"' in data
+        assert any(user.radius not in (0.5, 2, 5, 15) for user, _ in generator.get_queries(positions, 30))
+
+    def test_stats_rounding(self):
+        """Test the rounded statistics match their exact reference within the rounding error only"""
+
+        expected = [{"date": "2022-02-21", **DifferentialHarness.aggregate(prices=[1.9, 1.94075])}]
+        rounded = [{"date": "2022-02-21", "count": 2, "min": 1.9, "median": 1.9204, "mean": 1.9204, "p90": 1.9367}]
+        wrong = [{**rounded[0], "p90": 1.9366}]
+
+        assert DifferentialHarness.matches(view="stats", result=rounded, expected=expected)
+        assert not DifferentialHarness.matches(view="stats", result=wrong, expected=expected)
+        assert not DifferentialHarness.matches(view="stats", result=rounded + rounded, expected=expected)
@@ -0,0 +1,130 @@
+from search.search_utils.encoding_utils import PriceEncoder
+from search.search_utils.ingest_utils import PriceDataset
+
+import pytest
+
+
+class TestPriceEncoder:
+
+    @pytest.fixture
+    def get_updates(self):
+        """Provide a series of updates, not sorted by date as it can happen in the input data"""
+
+        return [(1645430400, 1.901), (1645466400, 1.911), (1645430000, 1.899), (1645516800, 2.105)]
+
+    def test_varint_round_trip(self):
+        """Test the varints are decoded as they were encoded"""
+
+        values = [0, 1, -1, 63, -64, 64, 1645430400, -1645430400, 2 ** 40, 2 ** 63, -2 ** 63 - 1, 10 ** 40]
+        buffer = bytearray()
+        for value in values:
+            PriceEncoder.encode_varint(value, buffer)
+
+        assert list(PriceEncoder.decode_varints(bytes(buffer))) == values
+
+    def test_series_round_trip(self, get_updates):
+        """Test a series is decoded as it was encoded"""
+
+        data = PriceEncoder.encode_series(updates=get_updates)
+
+        assert list(PriceEncoder.decode_series(data=data)) == get_updates
+
+    def test_series_compact(self, get_updates):
+        """Test the updates following each other take only a few bytes"""
+
+        data = PriceEncoder.encode_series(updates=get_updates)
+
+        assert len(data) < 1 + 6 + 2 + len(get_updates[1:]) * 5
+
+    @pytest.mark.parametrize("prices", [[1.8815, 1.901], [2.0, 1.90125], [1 / 3, 1.9], [float("nan"), 1.9],
+                                        [float("inf"), -0.0], [1e16], [1e20, 1.0], [-1e300, 1e-300]])
+    def test_series_lossless(self, prices):
+        """Test the prices needing more than 3 decimals are decoded as they were encoded"""
+
+        updates = [(1645430400 + index, price) for index, price in enumerate(prices)]
+        decoded = list(PriceEncoder.decode_series(data=PriceEncoder.encode_series(updates=updates)))
+
+        assert [repr(price) for _, price in decoded] == [repr(price) for price in prices]
+
+    def test_series_empty(self):
+        """Test an empty series is decoded as empty"""
+
+        assert list(PriceEncoder.decode_series(data=PriceEncoder.encode_series(updates=[]))) == []
+        assert list(PriceEncoder.decode_series(data=b"")) == []
+
+    def test_dataset_round_trip(self, get_updates, tmp_path):
+        """Test a dataset is read as it was written"""
+
+        dataset = PriceDataset()
+        dataset.add_station(id=750002001, latitude=48.82, longitude=-2.32, prices={6: get_updates, 1: []})
+        dataset.add_station(id=750002002, latitude=48.83, longitude=2.33, prices={})
+
+        path = str(tmp_path / "dataset.gsf")
+        dataset.save(path=path)
+        loaded = PriceDataset.load(path=path)
+
+        assert list(loaded.station_ids) == [750002001, 750002002]
+        assert list(loaded.longitudes) == [-2.32, 2.33]
+        assert list(loaded.get_series(station_index=0, gaz_id=6)) == list(dataset.get_series(0, 6))
+        assert list(loaded.get_series(station_index=1, gaz_id=6)) == []
+
+    def test_read_header(self, tmp_path):
+        """Test the metadata are read from the header and ignored when the format version differs"""
+
+        path = tmp_path / "dataset.gsf"
+        PriceEncoder.write(path=str(path), stations=[(1, 48.82, 2.32, {})], metadata={"source_size": 42})
+
+        assert PriceEncoder.read_header(path=str(path)) == {"source_size": 42}
+        assert list(PriceEncoder.read(path=str(path))) == [(1, 48.82, 2.32, {})]
+
+        path.write_bytes(PriceEncoder.MAGIC + bytes([0]) + path.read_bytes()[len(PriceEncoder.MAGIC) + 1:])
+
+        assert PriceEncoder.read_header(path=str(path)) is None
+        assert PriceEncoder.read_header(path=str(tmp_path / "missing.gsf")) is None
+        with pytest.raises(ValueError):
+            list(PriceEncoder.read(path=str(path)))
+
+    @pytest.mark.parametrize("cut", [1, 5, 30])
+    def test_read_truncated(self, get_updates, tmp_path, cut):
+        """Test an exception is raised when the dataset file is cut short, wherever the cut is"""
+
+        path = tmp_path / "dataset.gsf"
+        PriceEncoder.write(path=str(path), stations=[(1, 48.82, 2.32, {6: PriceEncoder.encode_series(get_updates)})])
+        path.write_bytes(path.read_bytes()[:-cut])
+
+        with pytest.raises(ValueError):
+            list(PriceEncoder.read(path=str(path)))
+
+    def test_read_wrong_format(self, tmp_path):
+        """Test an exception is raised when the file is not a dataset file"""
+
+        path = tmp_path / "dataset.gsf"
+        path.write_bytes(b"<xml/>")
+
+        with pytest.raises(ValueError):
+            list(PriceEncoder.read(path=str(path)))
+
+
+class TestPriceDataset:
+
+    @pytest.fixture
+    def get_dataset(self):
+        """Provide a dataset with a single station"""
+
+        dataset = PriceDataset()
+        dataset.add_station(id=1, latitude=48.82, longitude=2.32,
+                            prices={6: [(1000, 1.901), (2000, 1.911), (1500, 1.899), (2000, 1.921)]})
+        return dataset
+
+    def test_get_price_at(self, get_dataset):
+        """Test the price as of a date is the latest update before this date"""
+
+        assert get_dataset.get_price_at(station_index=0, gaz_id=6, timestamp=999) is None
+        assert get_dataset.get_price_at(station_index=0, gaz_id=6, timestamp=1000) == 1.901
+        assert get_dataset.get_price_at(station_index=0, gaz_id=6, timestamp=1700) == 1.899
+        assert get_dataset.get_price_at(station_index=0, gaz_id=6, timestamp=5000) == 1.921
+
+    def test_get_price_at_unknown_gaz(self, get_dataset):
+        """Test there is no price for a gaz the station does not sell"""
+
+        assert get_dataset.get_price_at(station_index=0, gaz_id=1, timestamp=5000) is None
@@ -0,0 +1,18 @@
+from search.search_utils.geohash_utils import GeoHash
+
+
+class TestGeoHash:
+
+    def test_encode(self):
+        """Test the geohash of a position is the expected one"""
+
+        assert GeoHash.encode(latitude=57.64911, longitude=10.40744, precision=11) == "u4pruydqqvj"
+
+    def test_decode_bounds(self):
+        """Test the position is inside the boundaries of its geohash cell"""
+
+        min_latitude, max_latitude, min_longitude, max_longitude = GeoHash.decode_bounds(geohash="u09tuc")
+
+        assert min_latitude <= 48.8319929 <= max_latitude
+        assert min_longitude <= 2.3245488 <= max_longitude
+        assert GeoHash.encode(latitude=48.8319929, longitude=2.3245488, precision=6) == "u09tuc"
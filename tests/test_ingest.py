@@ -0,0 +1,219 @@
+from search.search import Search
+from search.search_utils.ingest_utils import Ingestor, RejectionReport
+from search.search_utils.xml_parser_utils import XMLParser
+from search.search_utils.encoding_utils import PriceEncoder
+from search.components import User, Gaz
+
+import datetime
+import json
+import pytest
+
+
+XML_DATA = """<?xml version="1.0" encoding="UTF-8"?>
+<pdv_liste>
+  <prix nom="SP98" id="6" maj="2022-02-21T08:00:00" valeur="1.101"/>
+  <pdv id="1" latitude="4882000" longitude="232000">
+    <prix nom="SP98" id="6" maj="2022-02-21T08:00:00" valeur="1.901"/>
+    <prix nom="SP98" id="6" maj="2022-02-21T07:00:00" valeur="1.891"/>
+    <prix nom="SP98" id="6" valeur="1.881"/>
+    <prix nom="SP98" id="6" maj="2022-02-21T09:00:00" valeur="1.8815"/>
+  </pdv>
+  <pdv id="2" latitude="4883000" longitude="233000">
+    <prix nom="SP98" id="6" maj="2022-2-21T9:00:00" valeur="1.891"/>
+    <prix nom="SP98" id="x" maj="2022-02-21T10:00:00" valeur="1.921"/>
+  </pdv>
+  <pdv id="3" latitude="48.83.1" longitude="233000">
+    <prix nom="SP98" id="6" maj="2022-02-21T09:00:00" valeur="1.501"/>
+  </pdv>
+  <pdv id="4" latitude="4883500" longitude="231500">
+    <prix nom="SP98" id="6" maj="2022-02-30T10:00:00" valeur="1.931"/>
+    <prix nom="SP98" id="6" maj="2022-02-21T10:00:00" valeur="abc"/>
+  </pdv>
+  <pdv id="1" latitude="4883100" longitude="232100">
+    <prix nom="SP98" id="6" maj="2022-02-21T11:00:00" valeur="1.871"/>
+  </pdv>
+  <pdv id="5" latitude="9900000" longitude="232000">
+    <prix nom="Gazole" id="1" maj="2022-02-21T10:00:00" valeur="1.801"/>
+  </pdv>
+</pdv_liste>
+"""
+
+CLEAN_XML_DATA = """<?xml version="1.0" encoding="UTF-8"?>
+<pdv_liste>
+  <pdv id="1" latitude="4882000" longitude="232000">
+    <prix nom="SP98" id="6" maj="2022-02-21T08:00:00" valeur="1.901"/>
+    <prix nom="SP98" id="6" maj="2022-02-21T07:00:00" valeur="1.891"/>
+    <prix nom="SP98" id="6" valeur="1.881"/>
+  </pdv>
+  <pdv id="2" latitude="4883000" longitude="233000">
+    <prix nom="SP98" id="6" maj="2022-2-21T9:00:00" valeur="1.891"/>
+    <prix nom="SP98" id="6" maj="2022-02-22T10:00:00" valeur="1.921"/>
+  </pdv>
+  <pdv id="3" latitude="" longitude="233000">
+    <prix nom="SP98" id="6" maj="2022-02-21T09:00:00" valeur="1.501"/>
+  </pdv>
+  <pdv id="4" latitude="4883500" longitude="231500">
+    <prix nom="Gazole" id="1" maj="2022-02-21T10:00:00" valeur="1.931"/>
+  </pdv>
+  <pdv id="1" latitude="4883100" longitude="232100">
+    <prix nom="SP98" id="6" maj="2022-02-21T11:00:00" valeur="1.871"/>
+  </pdv>
+  <pdv id="4" latitude="4883600" longitude="231600">
+    <prix nom="SP98" id="6" maj="2022-02-21T10:00:00" valeur="1.861"/>
+  </pdv>
+</pdv_liste>
+"""
+
+
+class TestIngestor:
+
+    @pytest.fixture
+    def get_path(self, tmp_path):
+        """Provide the path of an input data file with malformed rows"""
+
+        path = tmp_path / "data.xml"
+        path.write_text(XML_DATA)
+        return str(path)
+
+    @pytest.mark.parametrize("value", ["2022-02-21T08:03:09", "2022-12-31T23:59:59", "2024-02-29T00:00:00",
+                                       "2022-2-1T8:3:9"])
+    def test_parse_date(self, value):
+        """Test the update dates are converted as strptime does"""
+
+        expected = Ingestor.to_timestamp(datetime.datetime.strptime(value, XMLParser.DATE_FORMAT))
+
+        assert Ingestor.parse_date(value=value) == expected
+
+    @pytest.mark.parametrize("value", ["", "2022-02-30T08:00:00", "2022-02-21T24:00:00", "2022-02-21T23:59:60",
+                                       "2022-02-21 08:00:00", "+022-02-21T08:00:00", "2022-02-21T08:00:00Z"])
+    def test_parse_date_invalid(self, value):
+        """Test an exception is raised for the dates strptime does not accept"""
+
+        with pytest.raises(ValueError):
+            Ingestor.parse_date(value=value)
+
+    def test_normalize_station(self):
+        """Test the raw attributes of a station are converted to typed values"""
+
+        report = RejectionReport()
+        attrib = {XMLParser.ID_IDENTIFIER: "750002001", XMLParser.LATITUDE_IDENTIFIER: "1288888",
+                  XMLParser.LONGITUDE_IDENTIFIER: "-8909888"}
+
+        assert Ingestor.normalize_station(attrib=attrib, report=report) == (750002001, 12.88888, -89.09888)
+        assert report.rejected == {}
+
+    def test_normalize_price(self):
+        """Test the raw attributes of a price are converted to typed values"""
+
+        report = RejectionReport()
+        attrib = {XMLParser.ID_IDENTIFIER: "6", XMLParser.UPDATE_IDENTIFIER: "1970-01-02T00:00:01",
+                  XMLParser.PRICE_VALUE_IDENTIFIER: "1.999"}
+
+        assert Ingestor.normalize_price(attrib=attrib, station_id=1, report=report) == (6, 86401, 1.999)
+
+    def test_ingest_report(self, get_path):
+        """Test the malformed rows are dropped and reported by reason"""
+
+        report = RejectionReport()
+        dataset = Ingestor.ingest(data=XMLParser.load_data(path=get_path), report=report)
+
+        assert list(dataset.station_ids) == [1, 2, 4, 1, 5]
+        assert report.stations == 5
+        assert report.prices == 6
+        assert report.rejected == {
+            "price_without_station": {"count": 1, "samples": [None]},
+            "station_rejected": {"count": 1, "samples": [3]},
+            "invalid_gaz_id": {"count": 1, "samples": [2]},
+            "invalid_coordinates": {"count": 1, "samples": [3]},
+            "invalid_date": {"count": 1, "samples": [4]},
+            "invalid_price": {"count": 1, "samples": [4]},
+        }
+        assert report.flagged == {"coordinates_out_of_range": {"count": 1, "samples": [5]}}
+
+    def test_load(self, get_path, tmp_path):
+        """Test the dataset file and the report are written on the first load and the dataset file reused after"""
+
+        dataset_path = str(tmp_path / "data.gsf")
+        report_path = tmp_path / "rejections.json"
+
+        dataset = Ingestor.load(ressources_path=get_path, dataset_path=dataset_path, report_path=str(report_path))
+        report = json.loads(report_path.read_text())
+        report_path.unlink()
+        loaded = Ingestor.load(ressources_path="missing.xml", dataset_path=dataset_path, report_path=str(report_path))
+
+        assert report["stations"] == 5
+        assert report["rejected"]["invalid_date"]["count"] == 1
+        assert list(loaded.station_ids) == list(dataset.station_ids)
+        assert json.loads(report_path.read_text()) == report
+
+    def test_load_source_changed(self, get_path, tmp_path):
+        """Test the input data are ingested again when the XML file changed since the dataset file was written"""
+
+        dataset_path = str(tmp_path / "data.gsf")
+        report_path = tmp_path / "rejections.json"
+
+        Ingestor.load(ressources_path=get_path, dataset_path=dataset_path, report_path=str(report_path))
+
+        with open(get_path, "w") as file:
+            file.write(CLEAN_XML_DATA)
+
+        dataset = Ingestor.load(ressources_path=get_path, dataset_path=dataset_path, report_path=str(report_path))
+        loaded = Ingestor.load(ressources_path="missing.xml", dataset_path=dataset_path, report_path=str(report_path))
+
+        report = RejectionReport()
+        expected = Ingestor.ingest(data=XMLParser.load_data(path=get_path), report=report)
+
+        assert json.loads(report_path.read_text()) == report.to_dict()
+        assert list(dataset.station_ids) == list(expected.station_ids)
+        assert list(loaded.station_ids) == list(expected.station_ids)
+
+    @pytest.mark.parametrize("cut", [1, 20])
+    def test_load_truncated(self, get_path, tmp_path, cut):
+        """Test the input data are ingested again when the dataset file was cut short"""
+
+        dataset_path = tmp_path / "data.gsf"
+        report_path = str(tmp_path / "rejections.json")
+
+        Ingestor.load(ressources_path=get_path, dataset_path=str(dataset_path), report_path=report_path)
+        data = dataset_path.read_bytes()
+        dataset_path.write_bytes(data[:-cut])
+
+        dataset = Ingestor.load(ressources_path=get_path, dataset_path=str(dataset_path), report_path=report_path)
+
+        assert dataset_path.read_bytes() == data
+        assert list(dataset.get_series(station_index=4, gaz_id=1)) == [(1645437600, 1.801)]
+
+    def test_load_version_changed(self, get_path, tmp_path):
+        """Test the input data are ingested again when the dataset file was written with another format version"""
+
+        dataset_path = tmp_path / "data.gsf"
+        report_path = str(tmp_path / "rejections.json")
+
+        Ingestor.load(ressources_path=get_path, dataset_path=str(dataset_path), report_path=report_path)
+        data = dataset_path.read_bytes()
+        dataset_path.write_bytes(PriceEncoder.MAGIC + bytes([2]) + data[len(PriceEncoder.MAGIC) + 1:])
+
+        dataset = Ingestor.load(ressources_path=get_path, dataset_path=str(dataset_path), report_path=report_path)
+
+        assert dataset_path.read_bytes() == data
+        assert list(dataset.station_ids) == [1, 2, 4, 1, 5]
+
+    def test_process_dataset(self, tmp_path):
+        """Test the stations extracted from the dataset are the ones extracted from the input data"""
+
+        path = tmp_path / "clean.xml"
+        path.write_text(CLEAN_XML_DATA)
+
+        gaz = Gaz(gaz_type="SP98")
+        user = User(latitude=48.8319929, longitude=2.3245488, radius=5000,
+                    date=datetime.datetime(year=2022, month=2, day=21), gaz_type="SP98")
+        dataset = Ingestor.ingest(data=XMLParser.load_data(path=str(path)))
+
+        expected = [(station_id, station.latitude, station.longitude, station.price, station.distance)
+                    for station_id, station in Search.process_data(
+                        data=XMLParser.load_data(path=str(path)), user=user, requested_gaz=gaz).items()]
+        result = [(station_id, station.latitude, station.longitude, station.price, station.distance)
+                  for station_id, station in Search.process_dataset(
+                      dataset=dataset, user=user, requested_gaz=gaz).items()]
+
+        assert result == expected
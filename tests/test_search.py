@@ -1,9 +1,12 @@
-from search.search import Search
+from search.search import Search, SearchCache
 from search.search_utils.xml_parser_utils import XMLParser
+from search.search_utils.ingest_utils import Ingestor
 from search.components import User, Station, Gaz
 
 import pytest
 import datetime
+import random
+import threading
 
 
 class XMLElement:
@@ -151,3 +154,109 @@ class TestSearch:
         assert result[0].id == 1
         assert result[1].id == 2
         assert len(result) == 2
+
+
+class TestSearchCache:
+
+    @pytest.fixture
+    def get_path(self, tmp_path):
+        """Provide the path of an input data file with stations around a position, some sharing the same price"""
+
+        generator = random.Random(3)
+        rows = ['<?xml version="1.0" encoding="UTF-8"?>', "<pdv_liste>"]
+
+        for index in range(300):
+            station_id = 750000000 + index % 290
+            latitude = 4883000 + generator.randint(-8000, 8000)
+            longitude = 232000 + generator.randint(-12000, 12000)
+            rows.append('<pdv id="{}" latitude="{}" longitude="{}">'.format(station_id, latitude, longitude))
+            for hour in generator.sample(range(24), 3):
+                rows.append('<prix nom="SP98" id="6" maj="2022-02-{}T{:02d}:00:00" valeur="1.{}"/>'.format(
+                    generator.choice((20, 21)), hour, generator.randint(900, 910)))
+            rows.append("</pdv>")
+
+        rows.append("</pdv_liste>")
+        path = tmp_path / "data.xml"
+        path.write_text("\n".join(rows))
+        return str(path)
+
+    @pytest.fixture
+    def get_cache(self, get_path):
+        """Provide a cache over the ingested input data"""
+
+        return SearchCache(dataset=Ingestor.ingest(data=XMLParser.load_data(path=get_path)), max_size=2)
+
+    def get_user(self, latitude, longitude):
+        """Provide a user at the given position"""
+
+        return User(latitude=latitude, longitude=longitude, radius=4000,
+                    date=datetime.datetime(year=2022, month=2, day=21), gaz_type="SP98")
+
+    def test_find_stations(self, get_cache, get_path):
+        """Test the cached results are the same as the ones of the search for close users"""
+
+        gaz = Gaz(gaz_type="SP98")
+        generator = random.Random(5)
+
+        for _ in range(20):
+            user = self.get_user(latitude=48.83 + generator.uniform(-0.005, 0.005),
+                                 longitude=2.32 + generator.uniform(-0.005, 0.005))
+
+            stations = Search.process_data(data=XMLParser.load_data(path=get_path), user=user, requested_gaz=gaz)
+            expected = Search.format_output(gaz=gaz, stations=Search.find_stations(user=user, stations=stations))
+            result = Search.format_output(gaz=gaz, stations=get_cache.find_stations(user=user, requested_gaz=gaz))
+
+            assert result == expected
+
+        assert get_cache.hits > 0
+
+    def test_counters(self, get_cache):
+        """Test the hits, misses and evictions are counted"""
+
+        gaz = Gaz(gaz_type="SP98")
+
+        get_cache.find_stations(user=self.get_user(latitude=48.83, longitude=2.32), requested_gaz=gaz)
+        get_cache.find_stations(user=self.get_user(latitude=48.8301, longitude=2.3201), requested_gaz=gaz)
+        get_cache.find_stations(user=self.get_user(latitude=48.90, longitude=2.32), requested_gaz=gaz)
+        get_cache.find_stations(user=self.get_user(latitude=48.70, longitude=2.32), requested_gaz=gaz)
+
+        assert get_cache.get_counters() == {"hits": 1, "misses": 3, "evictions": 1, "size": 2}
+
+    def test_concurrent_fill(self, get_cache):
+        """Test a bucket is fetched once by concurrent misses, without blocking the other buckets during the fetch"""
+
+        gaz = Gaz(gaz_type="SP98")
+        fetch_candidates = get_cache.fetch_candidates
+        fetching = threading.Event()
+        release = threading.Event()
+        calls = []
+        released = []
+
+        def blocking_fetch(center, radius, requested_gaz, date):
+            calls.append(center)
+            if len(calls) == 1:
+                fetching.set()
+                released.append(release.wait(timeout=5))
+            return fetch_candidates(center=center, radius=radius, requested_gaz=requested_gaz, date=date)
+
+        get_cache.fetch_candidates = blocking_fetch
+        user = self.get_user(latitude=48.83, longitude=2.32)
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(get_cache.get_candidates(
+            user=user, requested_gaz=gaz))) for _ in range(4)]
+        threads[0].start()
+        fetching.wait(timeout=5)
+        for thread in threads[1:]:
+            thread.start()
+
+        other = get_cache.get_candidates(user=self.get_user(latitude=48.90, longitude=2.32), requested_gaz=gaz)
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        assert other is not None
+        assert released == [True]
+        assert len(calls) == 2
+        assert len(results) == 4 and all(result is results[0] for result in results)
+        assert get_cache.get_counters() == {"hits": 3, "misses": 2, "evictions": 0, "size": 2}
@@ -0,0 +1,225 @@
+from search.service import SearchService
+from search.components import User, Gaz
+
+import asyncio
+import datetime
+import json
+import threading
+import pytest
+
+
+class TestSearchService:
+
+    @pytest.fixture
+    def get_user(self):
+        """Provide a base user for all service test functions"""
+
+        return User(latitude=48.8319929, longitude=2.3245488,
+                    radius=5000, date=datetime.datetime(year=2022, month=2, day=21),
+                    gaz_type="SP98")
+
+    @pytest.fixture
+    def get_search(self):
+        """Provide a search blocking until released, counting its calls"""
+
+        class BlockingSearch:
+
+            def __init__(self):
+                self.calls = 0
+                self.release = threading.Event()
+
+            def __call__(self, user, gaz):
+                self.calls += 1
+                self.release.wait(timeout=5)
+                return {"name": gaz.gaz_type, "radius": user.radius}
+
+        return BlockingSearch()
+
+    @pytest.fixture
+    def get_writer(self):
+        """Provide a writer recording the response and whether the connection was closed"""
+
+        class Writer:
+
+            def __init__(self):
+                self.data = b""
+                self.closed = False
+
+            def write(self, data):
+                self.data += data
+
+            async def drain(self):
+                pass
+
+            def close(self):
+                self.closed = True
+
+            async def wait_closed(self):
+                pass
+
+        return Writer()
+
+    def test_coalesce(self, get_search, get_user):
+        """Test the identical requests in flight are computed once"""
+
+        service = SearchService(search=get_search, max_workers=2)
+
+        async def run():
+            requests = [asyncio.ensure_future(service.submit(user=get_user, gaz=Gaz(gaz_type="SP98")))
+                        for _ in range(5)]
+            await asyncio.sleep(0.05)
+            depth = service.get_metrics()["queue_depth"]
+            get_search.release.set()
+            return depth, await asyncio.gather(*requests)
+
+        depth, results = asyncio.run(run())
+
+        assert get_search.calls == 1
+        assert depth == 1
+        assert results == [(200, {"name": "SP98", "radius": 5.0})] * 5
+        assert service.get_metrics()["coalesced"] == 4
+        assert service.get_metrics()["queue_depth"] == 0
+
+    def test_backpressure(self, get_search, get_user):
+        """Test the requests are rejected when too many computations are pending"""
+
+        service = SearchService(search=get_search, max_workers=1, max_pending=2)
+
+        async def run():
+            requests = []
+            for radius in (1000, 2000, 3000):
+                user = User(latitude=get_user.latitude, longitude=get_user.longitude, radius=radius,
+                            date=get_user.date, gaz_type="SP98")
+                requests.append(asyncio.ensure_future(service.submit(user=user, gaz=Gaz(gaz_type="SP98"))))
+            await asyncio.sleep(0.05)
+            get_search.release.set()
+            return await asyncio.gather(*requests)
+
+        statuses = [status for status, _ in asyncio.run(run())]
+
+        assert statuses == [200, 200, 503]
+        assert service.get_metrics()["rejected"] == 1
+
+    def test_search_failure(self, get_user):
+        """Test a failing search is answered 500"""
+
+        def search(user, gaz):
+            raise RuntimeError("broken")
+
+        service = SearchService(search=search)
+
+        status, _ = asyncio.run(service.submit(user=get_user, gaz=Gaz(gaz_type="SP98")))
+
+        assert status == 500
+
+    def test_metrics(self, get_user):
+        """Test the latency percentiles are computed from the answered requests"""
+
+        service = SearchService(search=lambda user, gaz: {})
+
+        assert service.get_metrics()["p50_ms"] is None
+
+        asyncio.run(service.submit(user=get_user, gaz=Gaz(gaz_type="SP98")))
+        metrics = service.get_metrics()
+
+        assert metrics["requests"] == 1
+        assert metrics["p50_ms"] is not None
+        assert metrics["p99_ms"] >= metrics["p50_ms"]
+
+    def test_metrics_cache_counters(self):
+        """Test the counters of the cache used by the search are part of the metrics"""
+
+        service = SearchService(search=lambda user, gaz: {},
+                                get_cache_counters=lambda: {"hits": 3, "misses": 1, "evictions": 0, "size": 1})
+
+        metrics = service.get_metrics()
+
+        assert metrics["cache_hits"] == 3
+        assert metrics["cache_misses"] == 1
+        assert metrics["cache_size"] == 1
+        assert "cache_hits" not in SearchService(search=lambda user, gaz: {}).get_metrics()
+
+    def test_parse_request(self):
+        """Test the request parameters are validated as the command line arguments"""
+
+        user, gaz = SearchService.parse_request(
+            query="latitude=48.83&longitude=2.32&radius=5000&date=2022-02-21&gaz_type=SP98")
+
+        assert user.get_position() == (48.83, 2.32)
+        assert user.radius == 5.0
+        assert user.date == datetime.datetime(year=2022, month=2, day=21)
+        assert gaz.id == 6
+
+    @pytest.mark.parametrize("query", ["latitude=91&longitude=2.32&radius=5000&date=2022-02-21&gaz_type=SP98",
+                                       "latitude=48.83&longitude=2.32&radius=5000&date=2022-02-21&gaz_type=Kero",
+                                       "latitude=48.83&longitude=2.32&date=2022-02-21&gaz_type=SP98"])
+    def test_parse_request_invalid(self, query):
+        """Test an exception is raised when a parameter is wrong or missing"""
+
+        with pytest.raises(ValueError):
+            SearchService.parse_request(query=query)
+
+    def test_http(self):
+        """Test the search and the metrics are served over HTTP"""
+
+        service = SearchService(search=lambda user, gaz: {"name": gaz.gaz_type, "stations": []})
+
+        async def get(port, target):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write("GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n".format(target).encode())
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            head, body = response.split(b"\r\n\r\n", 1)
+            return int(head.split()[1]), json.loads(body)
+
+        async def run():
+            server = await asyncio.start_server(service.handle, host="127.0.0.1", port=0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return [await get(port, target) for target in (
+                    "/search?latitude=48.83&longitude=2.32&radius=5000&date=2022-02-21&gaz_type=E10",
+                    "/search?latitude=abc",
+                    "/metrics",
+                    "/unknown",
+                )]
+
+        responses = asyncio.run(run())
+
+        assert responses[0] == (200, {"name": "E10", "stations": []})
+        assert responses[1][0] == 400
+        assert responses[2][0] == 200
+        assert responses[2][1]["requests"] == 1
+        assert responses[3][0] == 404
+
+    def test_handle_unexpected_error(self, get_writer, monkeypatch):
+        """Test an unexpected error is answered 500 and the connection closed"""
+
+        service = SearchService(search=lambda user, gaz: {})
+        monkeypatch.setattr(service, "get_metrics", lambda: 1 / 0)
+
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"GET /metrics HTTP/1.1\r\n\r\n")
+            reader.feed_eof()
+            await service.handle(reader, get_writer)
+
+        asyncio.run(run())
+
+        assert get_writer.data.startswith(b"HTTP/1.1 500 Internal Server Error\r\n")
+        assert get_writer.closed
+
+    def test_handle_disconnect(self, get_writer):
+        """Test a client disconnecting before the response is not answered and its connection closed"""
+
+        service = SearchService(search=lambda user, gaz: {})
+
+        class Reader:
+
+            async def readline(self):
+                raise ConnectionResetError()
+
+        asyncio.run(service.handle(Reader(), get_writer))
+
+        assert get_writer.data == b""
+        assert get_writer.closed
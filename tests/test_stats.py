@@ -0,0 +1,119 @@
+from search.stats import Stats
+from search.search import Search
+from search.search_utils.ingest_utils import Ingestor
+from search.search_utils.xml_parser_utils import XMLParser
+from search.components import User, Gaz
+
+import pytest
+import datetime
+
+
+XML_DATA = """<?xml version="1.0" encoding="UTF-8"?>
+<pdv_liste>
+  <pdv id="1" latitude="4882000" longitude="232000">
+    <prix nom="SP98" id="6" maj="2022-02-21T08:00:00" valeur="1.901"/>
+    <prix nom="SP98" id="6" maj="2022-02-21T17:00:00" valeur="1.911"/>
+    <prix nom="SP98" id="6" maj="2022-02-22T08:00:00" valeur="1.899"/>
+    <prix nom="Gazole" id="1" maj="2022-02-21T08:00:00" valeur="1.701"/>
+  </pdv>
+  <pdv id="2" latitude="4883000" longitude="233000">
+    <prix nom="SP98" id="6" maj="2022-02-21T09:00:00" valeur="1.921"/>
+  </pdv>
+  <pdv id="3" latitude="" longitude="233000">
+    <prix nom="SP98" id="6" maj="2022-02-21T09:00:00" valeur="1.501"/>
+  </pdv>
+  <pdv id="4" latitude="4883500" longitude="231500">
+    <prix nom="SP98" id="6" maj="2022-02-21T10:00:00" valeur="1.931"/>
+    <prix nom="SP98" id="6" maj="2022-02-22T10:00:00" valeur="1.941"/>
+  </pdv>
+  <pdv id="5" latitude="4500000" longitude="500000">
+    <prix nom="SP98" id="6" maj="2022-02-21T10:00:00" valeur="1.001"/>
+  </pdv>
+</pdv_liste>
+"""
+
+
+class TestStats:
+
+    @pytest.fixture
+    def get_path(self, tmp_path):
+        """Provide the path of a small input data file"""
+
+        path = tmp_path / "data.xml"
+        path.write_text(XML_DATA)
+        return str(path)
+
+    @pytest.fixture
+    def get_dataset(self, get_path):
+        """Provide the ingested small input data"""
+
+        return Ingestor.ingest(data=XMLParser.load_data(path=get_path))
+
+    @pytest.fixture
+    def get_user(self):
+        """Provide a base user for all stats test functions"""
+
+        return User(latitude=48.8319929, longitude=2.3245488,
+                    radius=5000, date=datetime.datetime(year=2022, month=2, day=21),
+                    gaz_type="SP98")
+
+    def test_ingest(self, get_dataset):
+        """Test the stations with wrong coordinates are dropped and the prices are grouped by gaz"""
+
+        assert list(get_dataset.station_ids) == [1, 2, 4, 5]
+        assert get_dataset.latitudes[0] == 48.82
+        series = list(get_dataset.get_series(station_index=0, gaz_id=6))
+        assert [price for _, price in series] == [1.901, 1.911, 1.899]
+        assert series[0][0] == 1645430400
+        assert list(get_dataset.get_series(station_index=1, gaz_id=1)) == []
+
+    def test_get_area_stations(self, get_user, get_dataset):
+        """Test the stations outside of the user area are not kept"""
+
+        assert Stats.get_area_stations(user=get_user, dataset=get_dataset) == [0, 1, 2]
+
+    def test_get_percentile(self):
+        """Test the percentile is interpolated between the closest ranks"""
+
+        assert Stats.get_percentile(prices=[1.0, 2.0, 3.0, 4.0], percentile=0.5) == 2.5
+        assert Stats.get_percentile(prices=[1.0], percentile=0.9) == 1.0
+
+    def test_aggregate_empty(self):
+        """Test a day without price has no statistic"""
+
+        assert Stats.aggregate(prices=[]) == {"count": 0, "min": None, "median": None, "mean": None, "p90": None}
+
+    def test_compute(self, get_user, get_dataset):
+        """Test the statistics are computed for each day of the range"""
+
+        days = Stats.compute(user=get_user, requested_gaz=Gaz(gaz_type="SP98"), dataset=get_dataset,
+                             end_date=datetime.datetime(year=2022, month=2, day=23))
+
+        assert [day["date"] for day in days] == ["2022-02-21", "2022-02-22", "2022-02-23"]
+        assert days[0] == {"date": "2022-02-21", "count": 3, "min": 1.911, "median": 1.921,
+                           "mean": 1.921, "p90": 1.929}
+        assert days[1]["count"] == 2
+        assert days[1]["min"] == 1.899
+        assert days[2]["count"] == 0
+
+    def test_compute_end_before_start(self, get_user, get_dataset):
+        """Test an exception is raised when the end date is before the user date"""
+
+        with pytest.raises(ValueError):
+            Stats.compute(user=get_user, requested_gaz=Gaz(gaz_type="SP98"), dataset=get_dataset,
+                          end_date=datetime.datetime(year=2022, month=2, day=20))
+
+    def test_compute_matches_search(self, get_user, get_dataset, get_path):
+        """Test the prices of a day are the ones the search returns for that day"""
+
+        gaz = Gaz(gaz_type="SP98")
+        user = get_user
+        user.date = datetime.datetime(year=2022, month=2, day=22)
+
+        stations = Search.process_data(data=XMLParser.load_data(path=get_path), user=user, requested_gaz=gaz)
+        prices = sorted(station.price for _, station in Search.find_stations(user=user, stations=stations))
+
+        days = Stats.compute(user=user, requested_gaz=gaz, dataset=get_dataset, end_date=user.date)
+
+        assert days[0]["count"] == len(prices)
+        assert days[0]["min"] == prices[0]